@@ -0,0 +1,147 @@
+#
+# Host side benchmark of the BLE advertisement parser.
+#
+# Compares the original hex string based BLEItem.decode() with the offset based
+# parser in bletools, both in time and in allocations per advertisement.
+#
+#   python3 bench/bench_advparse.py [count]
+#
+import os
+import sys
+import time
+import random
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "sim"))
+sys.path.insert(0, ROOT)
+
+from bletools import BLEItem
+from displayhelper import BaseItem
+
+class LegacyBLEItem(BaseItem):
+    '''
+    The BLEItem decode path as it was before the offset based parser, kept here
+    so there is something to compare against.
+    '''
+    def __init__(self, addr_type, addr, adv_type, rssi, adv_data, itemFunction  ):
+        super().__init__( bytes(addr).hex(), itemFunction )
+        self.name      = bytes(addr).hex()
+        self.addr      = self.name
+        self.addr_type = addr_type
+        self.adv_type  = adv_type
+        self.rssi      = rssi
+        self.adv_data  = bytes(adv_data).hex()
+        self.data      = []
+        
+    def decodeName( self, data ):
+        return "".join([chr(int(data[i],16)) for i in range(0,len(data)) ])
+    
+    def _addData( self, AdType, AdData ):
+        for item in self.data:
+            if item[0] == AdType:
+                return
+        self.data.append( (AdType, AdData ) )
+        
+    def _leSwap16( self, data ):
+        value = [ data[1], data[0] ]
+        return "".join( value ).upper()
+    
+    def decode( self ):
+        data = [self.adv_data[i:i+2] for i in range(0, len(self.adv_data), 2)]
+        while len(data) > 0:
+            length = int(data[0],16)
+            AdType = int(data[1],16)
+            if length == 0:
+                break
+            if AdType == 0x09:
+                self.name = self.decodeName(data[2:length+1])
+                self._addData( "CompleteName", self.name )
+            elif AdType == 0x08:
+                self.name = self.decodeName(data[2:length+1])
+                self._addData( "ShortName",self.name )
+            elif AdType == 0x16:
+                self._addData( "UUID", "".join(data[2:length+1]) )
+            elif AdType == 0xFF:
+                self._addData( "ManData", "".join(data[2:length+1]) )
+            elif AdType == 0x01:
+                self._addData( "Flags", "".join(data[2:length+1]) )
+            elif AdType == 0x02:
+                self._addData( "Service ID", self._leSwap16( data[2:length+1]) )
+            elif AdType == 0x03:
+                self._addData( "All Service IDs", "".join(data[2:length+1]) )
+            elif AdType == 0x0A:
+                self._addData( "PowerLevel", "".join(data[2:length+1]) )
+            else:
+                self._addData( AdType, "".join(data[2:length+1]) )
+            data = data[length+1:]
+
+def makeAdvertisement( rnd ):
+    '''
+    Build a plausible legacy (31 byte max) advertisement.
+    '''
+    adv = bytearray( [2, 0x01, 0x06] )
+    choice = rnd.randrange(4)
+    if choice == 0:
+        name = b"Phone-%d" % rnd.randrange(1000)
+        adv += bytes( [len(name)+1, 0x09] ) + name
+    elif choice == 1:
+        adv += bytes( [3, 0x02, 0xAF, 0xFE] )
+    adv += bytes( [2, 0x0A, rnd.randrange(256)] )
+    room = 31 - len(adv) - 2
+    if room > 2:
+        size = rnd.randrange( 2, room+1 )
+        adv += bytes( [size+1, 0xFF] ) + bytes( rnd.randrange(256) for _ in range(size) )
+    return bytes(adv)
+
+def timeIt( label, count, ads, handler ):
+    t0 = time.perf_counter()
+    for i in range(count):
+        addr, adv = ads[i % len(ads)]
+        handler( addr, memoryview(adv) )
+    elapsed = time.perf_counter() - t0
+    print( f"{label:<26} {elapsed/count*1e6:8.2f} us/adv" )
+
+def allocIt( label, ads, handler ):
+    '''
+    Measure the transient heap each advertisement needs (the peak traced memory
+    while handling it) and the memory that stays allocated per kept item.
+    '''
+    kept = []
+    tracemalloc.start()
+    total = 0
+    for addr, adv in ads:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        kept.append( handler( addr, memoryview(adv) ) )
+        current, peak = tracemalloc.get_traced_memory()
+        total += peak - base
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print( f"{label:<26} {total/len(ads):8.1f} bytes peak/adv  {retained/len(ads):8.1f} bytes kept/item" )
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rnd = random.Random( 1 )
+    ads = [ (bytes( rnd.randrange(256) for _ in range(6) ), makeAdvertisement(rnd)) for _ in range(64) ]
+    
+    def legacy( addr, adv ):
+        item = LegacyBLEItem( 0, addr, 0, -60, adv, None )
+        item.decode()
+        return item
+        
+    def parsed( addr, adv ):
+        return BLEItem( 0, addr, 0, -60, adv, None )
+        
+    def rendered( addr, adv ):
+        item = BLEItem( 0, addr, 0, -60, adv, None )
+        str(item)
+        item.data
+        return item
+        
+    handlers = (("legacy decode()", legacy), ("offset parser", parsed), ("offset parser + render", rendered))
+    print( f"{count} advertisements, {len(ads)} distinct payloads" )
+    for label, handler in handlers:
+        timeIt( label, count, ads, handler )
+    for label, handler in handlers:
+        allocIt( label, ads, handler )
@@ -0,0 +1,71 @@
+#
+# Host side benchmark of BLEList updates.
+#
+# Fills a BLEList with 50, 500 and 2000 synthetic devices and then measures the
+# cost of handling an advertisement from an already known device, comparing the
+# original linear address scan with the keyed table.
+#
+#   python3 bench/bench_blelist.py [advertisements]
+#
+import io
+import os
+import sys
+import time
+import random
+import contextlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "sim"))
+sys.path.insert(0, ROOT)
+
+from bletools import BLEItem, BLEList
+
+class LegacyBLEList:
+    '''
+    BLEList.addItem as it was, a linear scan comparing hex address strings.  The
+    gc.collect() the original made on every duplicate is left out so only the
+    lookup is being compared.  The hex address is kept next to the item, as the
+    original BLEItem stored it as a string.
+    '''
+    def __init__(self):
+        self.mylist = []
+        
+    def addItem( self, bleItem ):
+        addr = bleItem.addr
+        for hexAddr, item in self.mylist:
+            if hexAddr == addr:
+                item.update( bleItem.addr_type, bleItem.adv_type, bleItem.rssi, bleItem.adv_data )
+                return
+        self.mylist.append( (addr, bleItem) )
+        
+ADV = bytes( [2, 0x01, 0x06, 7, 0x09] ) + b"Device" + bytes( [2, 0x0A, 0xF4] )
+
+def populate( bleList, addresses ):
+    with contextlib.redirect_stdout( io.StringIO() ):
+        for addr in addresses:
+            bleList.addItem( BLEItem( 0, addr, 0, -70, ADV, None ) )
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rnd = random.Random( 2 )
+    print( f"{'devices':>8} {'linear us/adv':>14} {'keyed us/adv':>13}" )
+    for devices in (50, 500, 2000):
+        addresses = [ bytes( rnd.randrange(256) for _ in range(6) ) for _ in range(devices) ]
+        traffic   = [ rnd.choice(addresses) for _ in range(count) ]
+        
+        legacy = LegacyBLEList()
+        populate( legacy, addresses )
+        t0 = time.perf_counter()
+        for addr in traffic:
+            legacy.addItem( BLEItem( 0, addr, 0, -60, ADV, None ) )
+        linear = (time.perf_counter() - t0) / count * 1e6
+        
+        keyed = BLEList()
+        populate( keyed, addresses )
+        t0 = time.perf_counter()
+        for addr in traffic:
+            keyed.upsert( 0, addr, 0, -60, memoryview(ADV), None )
+        indexed = (time.perf_counter() - t0) / count * 1e6
+        
+        assert len(keyed) == devices
+        print( f"{devices:>8} {linear:>14.2f} {indexed:>13.2f}" )
@@ -0,0 +1,110 @@
+#
+# Memory report, bytes per device for the WLAN and BLEItem records.
+#
+# Compares the original representation (an object per device carrying hex
+# strings, and for bluetooth a decoded list of tuples) with the packed records
+# kept in a RecordPool.  Only the devices themselves are measured, the indexes
+# WLANList and BLEList keep on top cost the same either way.  Runs under CPython (measured with tracemalloc) or on the
+# Pico (measured with gc.mem_alloc), though the figures are naturally different.
+#
+# The packed records include the RSSI history every device keeps (see rssitools.py).
+#
+#   python3 bench/bench_memory.py [devices]
+#
+import os
+import sys
+import gc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "sim"))
+sys.path.insert(0, ROOT)
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from recordpool import RecordPool
+from bletools import BLEItem, _BLE_SIZE as BLE_SIZE
+from wifitools import WLAN, _WLAN_SIZE as WLAN_SIZE
+from bench_advparse import LegacyBLEItem, makeAdvertisement
+
+class LegacyWLAN:
+    '''
+    The original WLAN, decoded strings and ints in a per object dict.
+    '''
+    def __init__(self,ssid,bssid,channel,rssi,security,hidden):
+        self.ssid     = ssid
+        self.bssid    = bssid
+        self.channel  = channel
+        self.rssi     = rssi
+        self.security = security
+        self.hidden   = hidden
+        self.count    = 0
+
+def measure( build ):
+    '''
+    Returns:
+        The bytes still allocated once build() has returned its result.
+    '''
+    gc.collect()
+    if tracemalloc:
+        tracemalloc.start()
+        kept = build()
+        used = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+    else:
+        before = gc.mem_alloc()
+        kept = build()
+        gc.collect()
+        used = gc.mem_alloc() - before
+    return used
+
+def scanResult( i ):
+    ssid = ("Network-%d" % i).encode()
+    return (ssid, bytes( [0x10, 0x20, 0x30, i >> 16 & 0xFF, i >> 8 & 0xFF, i & 0xFF] ), 1 + i % 11, -40 - i % 50, 4, 0)
+
+def report( label, devices, before, after ):
+    print( f"{label:<10} {before/devices:10.1f} {after/devices:10.1f} {100*(before-after)/before:8.1f}%" )
+
+if __name__ == "__main__":
+    import binascii
+    import random
+    devices = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    rnd = random.Random( 3 )
+    results = [ scanResult(i) for i in range(devices) ]
+    ads = [ (bytes( rnd.randrange(256) for _ in range(6) ), makeAdvertisement(rnd)) for _ in range(devices) ]
+    
+    def legacyWLANs():
+        return [ LegacyWLAN( w[0].decode(), binascii.hexlify(w[1]).decode(), w[2], w[3], w[4], w[5] ) for w in results ]
+    
+    def pooledWLANs():
+        pool  = RecordPool( WLAN_SIZE, 16 )
+        items = []
+        for w in results:
+            lan = WLAN( w[0], w[1], w[2], w[3], w[4], w[5] )
+            lan.attach( pool )
+            items.append( lan )
+        return items, pool
+    
+    def legacyBLE():
+        items = []
+        for addr, adv in ads:
+            item = LegacyBLEItem( 0, addr, 0, -60, adv, None )
+            item.decode()
+            items.append( item )
+        return items
+    
+    def pooledBLE():
+        pool  = RecordPool( BLE_SIZE )
+        items = []
+        for addr, adv in ads:
+            item = BLEItem( 0, addr, 0, -60, adv, None )
+            item.attach( pool )
+            items.append( item )
+        return items, pool
+    
+    print( f"{devices} devices, bytes per device" )
+    print( f"{'':<10} {'before':>10} {'after':>10} {'saved':>9}" )
+    report( "WLAN",    devices, measure( legacyWLANs ), measure( pooledWLANs ) )
+    report( "BLEItem", devices, measure( legacyBLE ),   measure( pooledBLE ) )
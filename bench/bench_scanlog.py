@@ -0,0 +1,56 @@
+#
+# Benchmark of the scan log writer, the records per second it sustains with
+# different block sizes, from one record per write upwards.  Runs under CPython
+# in a temporary directory, or on the Pico against the flash filesystem.
+#
+#   python3 bench/bench_scanlog.py [records]
+#
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "sim"))
+sys.path.insert(0, ROOT)
+
+import hostpatch
+from scanlog import ScanLog, LOG_BLE, readLog
+
+def writeIt( path, count, blockRecords ):
+    '''
+    Write count records through a ScanLog with the given block size.
+
+    Returns:
+        The records per second, and the ScanLog.
+    '''
+    log  = ScanLog( path, maxBytes=64*1024, files=2, blockRecords=blockRecords )
+    addr = bytearray( 6 )
+    t0 = time.perf_counter()
+    for i in range( count ):
+        addr[5] = i & 0xFF
+        log.record( LOG_BLE, addr, -60 - (i & 31), 0, 0x10, i & 0xFFFF )
+    log.flush()
+    elapsed = time.perf_counter() - t0
+    return count / elapsed, log
+
+def clean( path ):
+    for name in (path, path + ".1", path + ".2"):
+        try:
+            os.remove( name )
+        except OSError:
+            pass
+
+if __name__ == "__main__":
+    import tempfile
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    path  = os.path.join( tempfile.mkdtemp( prefix="scanlog-" ), "scan.log" )
+    print( f"{count} records, {path}" )
+    print( f"{'block':>6} {'records/s':>11} {'writes':>7} {'rotations':>9}" )
+    for blockRecords in (1, 8, 32, 128):
+        clean( path )
+        rate, log = writeIt( path, count, blockRecords )
+        stats = log.stats()
+        print( f"{blockRecords:>6} {rate:>11.0f} {stats['writes']:>7} {stats['rotations']:>9}" )
+    kept = sum( 1 for record in readLog( path ) if record[1] != "boot" )
+    print( f"{kept} records in the current log after rotation" )
+    clean( path )
@@ -0,0 +1,54 @@
+#
+# Benchmark NetMonitor's screens against simulated hardware.
+#
+# Each scenario runs the whole application under sim/run.py with a scripted set
+# of button presses and a simulated load, and reports the CPU time used and the
+# drawing done.
+#
+#   python3 bench/bench_screens.py [--json] [scenario ...]
+#
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUN  = os.path.join(ROOT, "sim", "run.py")
+
+SCENARIOS = {
+    "status" : ( [],
+                 ["down:0.5", "up", "select", "wait:5", "cancel"] ),
+    "networks-40" : ( ["--aps", "40", "--scan-time", "1.2"],
+                      ["down", "down", "select", "wait:8"] + ["down"] * 12 + ["select", "wait:8", "cancel", "cancel"] ),
+    "networks-40-partial" : ( ["--aps", "40", "--scan-time", "1.2", "--partial-update"],
+                              ["down", "down", "select", "wait:8"] + ["down"] * 12 + ["select", "wait:8", "cancel", "cancel"] ),
+    "bluetooth-300" : ( ["--ble", "300", "--rate", "300"],
+                        ["down", "select", "wait:4"] + ["down"] * 30 + ["wait:4", "select", "wait:4", "select", "wait:4", "cancel", "cancel"] ),
+}
+
+def run( name ):
+    options, buttons = SCENARIOS[name]
+    output = subprocess.run( [sys.executable, RUN, "--report"] + options + buttons,
+                             capture_output=True, text=True, timeout=300 ).stdout
+    for line in reversed( output.splitlines() ):
+        if line.startswith( "{" ):
+            return json.loads( line )
+    raise RuntimeError( f"{name}: no report\n{output}" )
+
+if __name__ == "__main__":
+    asJson = "--json" in sys.argv
+    names  = [name for name in sys.argv[1:] if name != "--json"] or list(SCENARIOS)
+    results = {}
+    if not asJson:
+        print( f"{'scenario':<20} {'secs':>6} {'cpu':>6} {'frames':>6} {'skipped':>7} {'text':>6} {'updates':>7} {'partial':>7} {'KB pushed':>9} {'dropped':>7}" )
+    for name in names:
+        result = run( name )
+        results[name] = result
+        if not asJson:
+            primitives = result.get( "primitives", {} )
+            frames     = result.get( "frames", {} )
+            print( f"{name:<20} {result['seconds']:>6.1f} {result['cpuSeconds']:>6.2f} {frames.get('frames', 0):>6} "
+                   f"{frames.get('framesSkipped', 0):>7} {primitives.get('text', 0):>6} {primitives.get('update', 0):>7} "
+                   f"{primitives.get('partial_update', 0):>7} {frames.get('bytesPushed', 0)/1024:>9.0f} {result.get('bleDropped', 0):>7}" )
+    if asJson:
+        print( json.dumps( results, indent=2 ) )
@@ -1,10 +1,14 @@
 import bluetooth
+import binascii
 import time
 import re
 import gc
+import micropython
 
 from displayhelper import *
 from micropython import const
+from recordpool import RecordPool, BoundedList, getInt8, setInt8, getUInt32, setUInt32, setBytes
+from rssitools import RSSIRecord, RSSI_SIZE
 
 # Define BLE event constants
 _IRQ_CENTRAL_CONNECT             = const(1)
@@ -72,16 +76,250 @@ _ADTYPE_APPERANCE   = const(0x19)   # Appearance
 _ADTYPE_AD_INTERVAL = const(0x1A)   # Advertising Interval
 _ADTYPE_MAN_DATA    = const(0xFF)   # Manufacturer Specific Data
 
-class BLEItem(BaseItem):
+# Layout of a slot in the ScanRing
+_SLOT_ADDR_TYPE = const(0)
+_SLOT_ADV_TYPE  = const(1)
+_SLOT_RSSI      = const(2)
+_SLOT_LENGTH    = const(3)
+_SLOT_ADDR      = const(4)          # 6 byte address
+_SLOT_DATA      = const(10)         # advertisement data, up to _ADV_MAX bytes
+_ADV_MAX        = const(31)         # legacy advertisements carry at most 31 bytes
+_SLOT_SIZE      = const(41)
+
+_RING_SLOTS     = const(64)         # number of scan results the IRQ can queue up
+_DRAIN_BATCH    = const(16)         # number of scan results processed per drain
+
+# Layout of a BLEItem record
+_BLE_ADDR_TYPE  = const(0)
+_BLE_ADV_TYPE   = const(1)
+_BLE_RSSI       = const(2)
+_BLE_ADDR       = const(3)          # 6 byte raw address
+_BLE_ADV_LEN    = const(9)
+_BLE_ADV        = const(10)         # advertisement data, up to _ADV_MAX bytes
+_BLE_RSP_LEN    = const(41)
+_BLE_RSP        = const(42)         # scan response data, up to _ADV_MAX bytes
+_BLE_ADV_CRC    = const(73)         # crc32 of the advertisement data
+_BLE_RSP_CRC    = const(77)         # crc32 of the scan response data
+_BLE_SEEN       = const(81)         # ticks_ms of the last advertisement
+_BLE_HISTORY    = const(85)         # RSSI_SIZE bytes of smoothed RSSI and history, see rssitools.py
+_BLE_SIZE       = _BLE_HISTORY + RSSI_SIZE
+
+_ADV_LABELS = {
+    _ADTYPE_COMPLETE    : "CompleteName",
+    _ADTYPE_SHORT_NAME  : "ShortName",
+    _ADTYPE_SERVICEDATA : "UUID",
+    _ADTYPE_MAN_DATA    : "ManData",
+    _ADTYPE_FLAGS       : "Flags",
+    _ADTYPE_SERVICEID   : "Service ID",
+    _ADTYPE_SERVICEIDS  : "All Service IDs",
+    _ADTYPE_POWERLEVEL  : "PowerLevel",
+}
+
+_SERVICE_NAMES = {
+    "FEAF" : "Nest Labs Inc",
+    "FEB0" : "Nest Labs Inc",
+    "FE96" : "Tesla Motors",
+    "FE97" : "Tesla Motors",
+    "1122" : "BasicPrinting",
+}
+
+def adFind( buf, adType ):
+    '''
+    Walk the AD structures of a raw advertisement looking for a specific AD type.
+    The buffer is walked by offset only, so nothing is allocated while searching.
+    
+    Parameters:
+        buf    - Raw advertisement data (bytes, bytearray or memoryview)
+        adType - The AD type we are looking for
+        
+    Returns:
+        The offset of the first payload byte of the AD structure, or -1 if the
+        AD type is not present.  The payload ends at adEnd( buf, offset ).
+    '''
+    size  = len(buf)
+    index = 0
+    while index + 1 < size:
+        length = buf[index]
+        if length == 0:
+            break
+        if buf[index+1] == adType:
+            return index + 2
+        index += length + 1
+    return -1
+
+def adEnd( buf, offset ):
+    '''
+    Given the payload offset returned by adFind, return the offset one past the
+    end of the payload, clamped to the end of the buffer for truncated data.
+    '''
+    end = offset + buf[offset-2] - 1
+    if end > len(buf):
+        end = len(buf)
+    return end
+
+def adHex( buf, start, end ):
+    '''
+    Convert part of a raw advertisement into a hex string, only used when the
+    data is actually being displayed.
+    '''
+    return bytes(buf[start:end]).hex()
+
+def adText( buf, start, end ):
+    '''
+    Convert part of a raw advertisement into a string, one character per byte.
+    '''
+    return "".join([chr(buf[i]) for i in range(start, end)])
+
+def adName( buf ):
+    '''
+    Obtain the complete (or failing that the short) local name from a raw
+    advertisement.
+    
+    Returns:
+        The name, or None if the advertisement does not carry one.
+    '''
+    offset = adFind( buf, _ADTYPE_COMPLETE )
+    if offset < 0:
+        offset = adFind( buf, _ADTYPE_SHORT_NAME )
+    if offset < 0:
+        return None
+    return adText( buf, offset, adEnd( buf, offset ) )
+
+def adDecode( buf, data ):
+    '''
+    Decode every AD structure in a raw advertisement into display strings.  Every
+    item appended to data is a tuple of the type of data and the data itself.  If
+    data already holds an item of the same type the new one is tossed.
+    
+    Parameters:
+        buf  - Raw advertisement data
+        data - List of (label, value) tuples to add to
+        
+    Returns:
+        The data list that was passed in.
+    '''
+    size  = len(buf)
+    index = 0
+    while index + 1 < size:
+        length = buf[index]
+        if length == 0:
+            break
+        AdType = buf[index+1]
+        start  = index + 2
+        end    = index + length + 1
+        if end > size:
+            end = size
+        label = _ADV_LABELS.get( AdType, AdType )
+        for item in data:
+            if item[0] == label:
+                break
+        else:
+            if AdType == _ADTYPE_COMPLETE or AdType == _ADTYPE_SHORT_NAME:
+                value = adText( buf, start, end )
+            elif AdType == _ADTYPE_SERVICEID:
+                value = adHex( buf, start, start+2 )
+                value = (value[2:4] + value[0:2]).upper()
+                value = _SERVICE_NAMES.get( value, value )
+            else:
+                value = adHex( buf, start, end )
+            data.append( (label, value) )
+        index = end
+    return data
+
+def bleKey( addr_type, addr ):
+    '''
+    Build the key used to index a device in a BLEList, the address type followed
+    by the raw 6 byte address.
+    '''
+    return bytes((addr_type,)) + bytes(addr)
+
+class BLEItem(BaseItem, RSSIRecord):
+    '''
+    A bluetooth device we have seen.  Everything we know about the device is packed
+    into a single record; while the item is held by a BLEList the record lives in the
+    list's RecordPool, otherwise in a small buffer of its own.  Nothing is decoded
+    until it is asked for.  The record also carries the smoothed RSSI and a history
+    of the recent RSSI, filled by every advertisement taken from the device.
+    '''
+    RECORD_SIZE = _BLE_SIZE
+    RSSI_OFFSET = _BLE_HISTORY
+    
     def __init__(self, addr_type, addr, adv_type, rssi, adv_data, itemFunction  ):
-        super().__init__( bytes(addr).hex(), itemFunction )
-        self.name      = bytes(addr).hex()
-        self.addr      = self.name
+        super().__init__( None, itemFunction )
+        self.newRecord()
+        setBytes( self._buf, _BLE_ADDR, addr, 6 )
         self.addr_type = addr_type
         self.adv_type  = adv_type
         self.rssi      = rssi
-        self.adv_data  = bytes(adv_data).hex()
-        self.data      = []
+        self.lastSeen  = time.ticks_ms()
+        self._setData( adv_type, adv_data, binascii.crc32( adv_data ) )
+        self.addSample( rssi )
+        self.version   = 0      # bumped whenever what the listbox shows changes
+        self.seq       = 0      # order the device was added to its BLEList in
+        
+    @property
+    def addr_type( self ):
+        return self._buf[self._off+_BLE_ADDR_TYPE]
+    
+    @addr_type.setter
+    def addr_type( self, value ):
+        self._buf[self._off+_BLE_ADDR_TYPE] = value
+        
+    @property
+    def adv_type( self ):
+        return self._buf[self._off+_BLE_ADV_TYPE]
+    
+    @adv_type.setter
+    def adv_type( self, value ):
+        self._buf[self._off+_BLE_ADV_TYPE] = value
+        
+    @property
+    def rssi( self ):
+        return getInt8( self._buf, self._off+_BLE_RSSI )
+    
+    @rssi.setter
+    def rssi( self, value ):
+        setInt8( self._buf, self._off+_BLE_RSSI, value )
+        
+    @property
+    def lastSeen( self ):
+        return getUInt32( self._buf, self._off+_BLE_SEEN )
+    
+    @lastSeen.setter
+    def lastSeen( self, value ):
+        setUInt32( self._buf, self._off+_BLE_SEEN, value )
+        
+    @property
+    def advCRC( self ):
+        return getUInt32( self._buf, self._off+_BLE_ADV_CRC )
+    
+    @property
+    def rawAddr( self ):
+        return bytes( self._buf[self._off+_BLE_ADDR:self._off+_BLE_ADDR+6] )
+    
+    @property
+    def addr( self ):
+        return self.rawAddr.hex()
+    
+    @property
+    def key( self ):
+        return bleKey( self.addr_type, self.rawAddr )
+    
+    @property
+    def adv_data( self ):
+        '''
+        The raw advertisement data, a view onto the record rather than a copy.
+        '''
+        offset = self._off + _BLE_ADV
+        return memoryview( self._buf )[offset:offset+self._buf[self._off+_BLE_ADV_LEN]]
+    
+    @property
+    def rsp_data( self ):
+        '''
+        The raw scan response data, a view onto the record rather than a copy.
+        '''
+        offset = self._off + _BLE_RSP
+        return memoryview( self._buf )[offset:offset+self._buf[self._off+_BLE_RSP_LEN]]
         
     def getAddrType(self):
         if self.addr_type == ADDR_TYPE_PUBLIC:
@@ -92,105 +330,119 @@ class BLEItem(BaseItem):
             return "UNKNOWN"
         
     def getColor(self):
-        if self.rssi > -67:
-            return COLOR_GREEN
-        elif self.rssi > -70:
-            return COLOR_YELLOW
-        elif self.rssi > -80:
-            return COLOR_ORANGE
-        elif self.rssi > -90:
-            return COLOR_RED
-        else:
-            return COLOR_RED
+        return rssiColor( self.smoothed )
         
     def getName( self ):
         return self.addr
-       
-    def decodeName( self, data ):
-        return "".join([chr(int(data[i],16)) for i in range(0,len(data)) ])
-        #name = ""
-        #for i in range(0,len(data)):
-        #    name += chr(int(data[i],16))
-        #return name
     
-    def _addData( self, AdType, AdData ):
+    def _setData( self, adv_type, adv_data, crc ):
         '''
-        Add an item to our advertisement data list.  Every item in the list is a
-        tuple consisting of the type of data, and the data itself.  If we already
-        have that data, toss it.  If not, add it to our stored data items
-        
-        Parameters:
-            AdType - Type of advertisement data inbound
-            AdData - Advertisement data we want to store.
+        Copy the raw advertisement, and its crc, into the record.  Scan responses
+        are kept apart from the advertisement proper, as they normally carry
+        different AD structures (the name for instance).  Nothing is decoded here.
+        '''
+        if adv_type == _ADV_SCAN_RSP:
+            self._buf[self._off+_BLE_RSP_LEN] = setBytes( self._buf, self._off+_BLE_RSP, adv_data, _ADV_MAX )
+            setUInt32( self._buf, self._off+_BLE_RSP_CRC, crc )
+        elif adv_type >= _ADV_IND and adv_type < _ADV_SCAN_RSP:
+            self._buf[self._off+_BLE_ADV_LEN] = setBytes( self._buf, self._off+_BLE_ADV, adv_data, _ADV_MAX )
+            setUInt32( self._buf, self._off+_BLE_ADV_CRC, crc )
             
+    def sameData( self, adv_type, crc ):
         '''
-        for item in self.data:
-            if item[0] == AdType:
-                return
-        self.data.append( (AdType, AdData ) )
-        
-    def _leSwap16( self, data ):
+        Returns:
+            True if the advertisement (or scan response) with the given crc is the
+            same as the one already stored.
         '''
-        Convert a 16 bit data item into a little endian data type (i.e. byte swap)
+        if adv_type == _ADV_SCAN_RSP:
+            return getUInt32( self._buf, self._off+_BLE_RSP_CRC ) == crc
+        return self.advCRC == crc
         
-        Parameter:
-            Two bydes of data
-            
-        Returns:
-            The two bytes swapped.
+    def seen( self, adv_type, rssi, now ):
+        '''
+        Update this item from an advertisement identical to the one stored, only
+        the signal strength and the time it was last seen change.
         '''
-        value = [ data[1], data[0] ]
-        return "".join( value ).upper()
+        self.adv_type  = adv_type
+        self.rssi      = rssi
+        self.lastSeen  = now
+        smoothed = self.smoothed
+        self.addSample( rssi )
+        if self.smoothed != smoothed:
+            self.version += 1
         
+    def update( self, addr_type, adv_type, rssi, adv_data, crc=None ):
+        '''
+        Update this item from a newly received advertisement for the same address.
+        '''
+        if crc is None:
+            crc = binascii.crc32( adv_data )
+        self.addr_type = addr_type
+        self.adv_type  = adv_type
+        self.rssi      = rssi
+        self.lastSeen  = time.ticks_ms()
+        self._setData( adv_type, adv_data, crc )
+        self.addSample( rssi )
+        self.version  += 1
     
-    def decode( self ):
-        if self.adv_type >= _ADV_IND and self.adv_type <= _ADV_SCAN_RSP:
-            data = [self.adv_data[i:i+2] for i in range(0, len(self.adv_data), 2)]
-            while len(data) > 0:
-                try:
-                    length = int(data[0],16)
-                    AdType = int(data[1],16)
-                    if length == 0:
-                        break
-                    if AdType == _ADTYPE_COMPLETE:
-                        self.name = self.decodeName(data[2:length+1])
-                        self._addData( "CompleteName", self.name )
-                    elif AdType == _ADTYPE_SHORT_NAME:
-                        self.name = self.decodeName(data[2:length+1])
-                        self._addData( "ShortName",self.name )
-                    elif AdType == _ADTYPE_SERVICEDATA:
-                        self._addData( "UUID", "".join(data[2:length+1]) )
-                    elif AdType == _ADTYPE_MAN_DATA:
-                        self._addData( "ManData", "".join(data[2:length+1]) )
-                    elif AdType == _ADTYPE_FLAGS:
-                        self._addData( "Flags", "".join(data[2:length+1]) )
-                    elif AdType == _ADTYPE_SERVICEID:
-                        value = self._leSwap16( data[2:length+1])
-                        if value == "FEAF" or value == "FEB0":
-                            value = "Nest Labs Inc"
-                        elif value == "FE96" or value == "FE97":
-                            value = "Tesla Motors"
-                        elif value == "1122":
-                            value = "BasicPrinting"
-                        self._addData( "Service ID", value )
-                    elif AdType == _ADTYPE_SERVICEIDS:
-                        self._addData( "All Service IDs", "".join(data[2:length+1]) )
-                    elif AdType == _ADTYPE_POWERLEVEL:
-                        self._addData( "PowerLevel", "".join(data[2:length+1]) )
-                    else:
-                        self._addData( AdType, "".join(data[2:length+1]) )
-                    data = data[length+1:]
-                except Exception as e:
-                    print( f'Exception data failure {self.adv_data} {"".join(data)} error {e}' )
-                    
+    @property
+    def name( self ):
+        '''
+        The local name of the device, from the advertisement or scan response,
+        falling back to the address if the device does not advertise one.
+        '''
+        name = adName( self.rsp_data )
+        if name is None:
+            name = adName( self.adv_data )
+        if name is None:
+            name = self.addr
+        return name
+    
+    @property
+    def data( self ):
+        '''
+        A list of (label, value) tuples describing the advertisement data.
+        '''
+        return adDecode( self.rsp_data, adDecode( self.adv_data, [] ) )
         
     def __str__(self):
-        return f"{self.name}\t{self.addr_type}\t{self.adv_type}\t{self.rssi}"
+        return f"{self.name}\t{self.addr_type}\t{self.adv_type}\t{self.smoothed}"
 
-class BLEList:
-    def __init__(self):
+class BLEList(ListModel, BoundedList):
+    '''
+    BLEList - The list of bluetooth devices we have seen.  Devices are kept in the
+    order they were first seen (which is the order the listbox shows them in), and
+    are also indexed by their key (address type plus raw address) so that finding
+    a device again costs the same no matter how many devices are in the list.
+    
+    The list is the listbox's model, so only the devices on screen are formatted.
+    Every device is numbered as it is added, so the list is always in order of
+    that number and a device's row can be found by binary search.
+    
+    The list can be bounded, by a number of devices or by a floor on gc.mem_free(),
+    see BoundedList.
+    '''
+    def __init__( self, minInterval=0, maxItems=0, memFloor=0, collect=None ):
+        '''
+        Parameters:
+            minInterval - Advertisements from a device arriving less than this many
+                          milliseconds after the last one are dropped, see upsert
+            maxItems    - Most devices kept, 0 for no limit
+            memFloor    - Evict devices when adding one finds less free memory
+                          than this, 0 for never
+            collect     - Function that runs a collection, see BoundedList
+        '''
         self.mylist = []
+        self.table  = {}
+        self.pool   = RecordPool( _BLE_SIZE )
         self.index  = -1
+        self.minInterval = minInterval
+        self.received    = 0        # advertisements handed to upsert
+        self.decoded     = 0        # ... that were new or changed, and so were stored
+        self.duplicates  = 0        # ... identical to the stored one, only RSSI updated
+        self.limited     = 0        # ... too soon after the last, dropped
+        self.sequence    = 0        # number given to the next device added
+        self.bound( maxItems, memFloor, collect )
         
     def __iter__(self):
         '''
@@ -227,33 +479,396 @@ class BLEList:
         '''
         return len(self.mylist)
     
+    def rowCount( self ):
+        return len(self.mylist)
+    
+    def rowItem( self, index ):
+        return self.mylist[index]
+    
+    def rowText( self, index ):
+        return str(self.mylist[index])
+    
+    def rowColor( self, index ):
+        return self.mylist[index].getColor()
+    
+    def rowVersion( self, index ):
+        return self.mylist[index].version
+    
+    def rowKey( self, index ):
+        return self.mylist[index].key
+    
+    def rowIndex( self, key, hint=-1 ):
+        '''
+        Find the row of a device by its key, by binary search on the number it was
+        added with rather than by walking the list.
+        
+        Returns:
+            The index, or -1 if the device is no longer in the list.
+        '''
+        item = self.table.get( key )
+        if item is None:
+            return -1
+        mylist = self.mylist
+        if 0 <= hint < len(mylist) and mylist[hint] is item:
+            return hint
+        low  = 0
+        high = len(mylist)
+        while low < high:
+            middle = (low + high) // 2
+            if mylist[middle].seq < item.seq:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(mylist) and mylist[low] is item:
+            return low
+        return -1
+    
+    def get( self, key ):
+        '''
+        Obtain the item stored under the given key (see bleKey), or None if there
+        is no such device.
+        '''
+        return self.table.get( key )
+    
     def addItem( self, bleItem ):
-        global stuff
         '''
         addItem - This function adds an item into the mylist, if and only if it is not a duplicate.
-                  The definition of a duplicate is address matches 
+                  The definition of a duplicate is the address type and address match
         '''
-        for item in self.mylist:
-            if item.addr == bleItem.addr:
-                item.addr_type = bleItem.addr_type 
-                item.rssi      = bleItem.rssi
-                item.adv_type  = bleItem.adv_type
-                item.adv_data  = bleItem.adv_data
-                item.decode()
-                gc.collect()
-                return
-        print( f"Found : {bleItem}\t{bleItem.adv_data}" )
-        bleItem.decode()
+        item = self.table.get( bleItem.key )
+        if item is not None:
+            if bleItem.adv_type == _ADV_SCAN_RSP:
+                adv_data = bleItem.rsp_data
+            else:
+                adv_data = bleItem.adv_data
+            item.update( bleItem.addr_type, bleItem.adv_type, bleItem.rssi, adv_data )
+            return
+        self._makeRoom()
+        bleItem.attach( self.pool )
+        self.table[bleItem.key] = bleItem
+        bleItem.seq = self.sequence
+        self.sequence += 1
         self.mylist.append( bleItem )
+        
+    def upsert( self, addr_type, addr, adv_type, rssi, adv_data, itemFunction ):
+        '''
+        upsert - Update the device with the given address from a scan result, or add
+                 it if we have not seen it before.  A new BLEItem is only created
+                 for devices we have not seen.  An advertisement that comes within
+                 minInterval of the last one from the device is dropped, whether
+                 or not its payload changed, so devices that rotate their payload
+                 are rate limited too.  The one exception is a changed scan
+                 response straight after an advertisement was taken, as it
+                 usually follows the advertisement within a few milliseconds.
+                 Otherwise an advertisement identical to the one stored (by crc)
+                 only updates the RSSI and last seen time.
+                 
+        Returns:
+            The item that was updated or added.
+        '''
+        self.received += 1
+        item = self.table.get( bleKey( addr_type, addr ) )
+        if item is None:
+            item = BLEItem( addr_type, addr, adv_type, rssi, adv_data, itemFunction )
+            self.addItem( item )
+            self.decoded += 1
+            return item
+        now = time.ticks_ms()
+        crc = binascii.crc32( adv_data )
+        same = item.sameData( adv_type, crc )
+        response = adv_type == _ADV_SCAN_RSP and item.adv_type != _ADV_SCAN_RSP and not same
+        if time.ticks_diff( now, item.lastSeen ) < self.minInterval and not response:
+            self.limited += 1
+        elif same:
+            item.seen( adv_type, rssi, now )
+            self.duplicates += 1
+        else:
+            item.update( addr_type, adv_type, rssi, adv_data, crc )
+            self.decoded += 1
+        return item
+    
+    def members( self ):
+        return self.mylist
+    
+    def _setMembers( self, items ):
+        self.mylist = items
+        
+    def _remove( self, item ):
+        '''
+        Drop a device from the index and release its record, the caller takes care
+        of mylist.
+        '''
+        del self.table[item.key]
+        item.detach( self.pool )
+        
+    def retain( self, keep ):
+        '''
+        retain - Remove the devices for which keep( item ) is False, never the pinned one.
+        
+        Returns:
+            The number of devices removed.
+        '''
+        doomed = {}
+        for item in self.mylist:
+            if item is not self.pinned and not keep( item ):
+                doomed[item] = True
+                self._remove( item )
+        if len(doomed):
+            self.mylist = [ item for item in self.mylist if item not in doomed ]
+        return len(doomed)
+    
+    def stats( self ):
+        '''
+        Returns:
+            The advertisement counters, see __init__, and the eviction counters.
+        '''
+        return { "received"      : self.received,
+                 "decoded"       : self.decoded,
+                 "duplicates"    : self.duplicates,
+                 "limited"       : self.limited,
+                 "items"         : len(self.mylist),
+                 "evicted"       : self.evicted,
+                 "evictedMemory" : self.evictedMemory }
+    
+#
+# Reasons a BLEFilter rejects an advertisement, in the order they are checked, cheapest first
+#
+FILTER_ADDR_TYPE = const(0)
+FILTER_RSSI      = const(1)
+FILTER_PREFIX    = const(2)
+FILTER_AD_TYPE   = const(3)
+FILTER_UUID      = const(4)
+FILTER_NAME      = const(5)
+FILTER_REASONS   = ("addrType", "rssi", "prefix", "adType", "uuid", "name")
+
+class BLEFilter:
+    '''
+    BLEFilter - Decides, from the raw advertisement, whether a device is of interest.
+    Every condition given has to hold; a condition given several values holds if
+    any of them does.  Conditions left as None always hold.
+    
+    Nothing is allocated to check an advertisement, apart from the name condition
+    which copies the name out to search it.
+    '''
+    def __init__( self, prefixes=None, minRSSI=None, addrTypes=None, adTypes=None, uuids=None, names=None ):
+        '''
+        Parameters:
+            prefixes  - Address prefixes, as hex strings ("28:cd:c1" for an OUI, or a
+                        whole address)
+            minRSSI   - Weakest signal accepted, in dBm
+            addrTypes - Address types accepted (0 public, 1 random)
+            adTypes   - AD types, one of which has to be present
+            uuids     - 16 bit service UUIDs, one of which has to be listed (AD types
+                        0x02 and 0x03) or carry service data (AD type 0x16)
+            names     - Name substrings, one of which has to be in the local name,
+                        ignoring case
+        '''
+        self.prefixes  = filterList( prefixes,  filterPrefix )
+        self.minRSSI   = minRSSI
+        self.addrTypes = filterList( addrTypes, int )
+        self.adTypes   = filterList( adTypes,   int )
+        self.uuids     = filterList( uuids,     int )
+        self.names     = filterList( names,     lambda name: name.lower().encode() )
+        self.rejects   = [0] * len(FILTER_REASONS)     # advertisements rejected, by reason
+        
+    def match( self, addr_type, addr, rssi, adv ):
+        '''
+        Check a raw advertisement against the filter.
+        
+        Returns:
+            -1 if the advertisement passes, otherwise the FILTER_* reason it failed.
+        '''
+        if self.addrTypes is not None and addr_type not in self.addrTypes:
+            return FILTER_ADDR_TYPE
+        if self.minRSSI is not None and rssi < self.minRSSI:
+            return FILTER_RSSI
+        if self.prefixes is not None:
+            for prefix in self.prefixes:
+                index = len(prefix) - 1
+                while index >= 0 and addr[index] == prefix[index]:
+                    index -= 1
+                if index < 0:
+                    break
+            else:
+                return FILTER_PREFIX
+        if self.adTypes is not None:
+            for adType in self.adTypes:
+                if adFind( adv, adType ) >= 0:
+                    break
+            else:
+                return FILTER_AD_TYPE
+        if self.uuids is not None and not adHasUUID( adv, self.uuids ):
+            return FILTER_UUID
+        if self.names is not None:
+            offset = adFind( adv, _ADTYPE_COMPLETE )
+            if offset < 0:
+                offset = adFind( adv, _ADTYPE_SHORT_NAME )
+            if offset < 0:
+                return FILTER_NAME
+            name = bytes( adv[offset:adEnd( adv, offset )] ).lower()
+            for wanted in self.names:
+                if name.find( wanted ) >= 0:
+                    break
+            else:
+                return FILTER_NAME
+        return -1
+    
+    def matchItem( self, item ):
+        '''
+        Check a device already in a BLEList, against its advertisement and its scan
+        response.
+        '''
+        return self.match( item.addr_type, item.rawAddr, item.rssi, item.adv_data ) < 0 or \
+               self.match( item.addr_type, item.rawAddr, item.rssi, item.rsp_data ) < 0
+    
+    def stats( self ):
+        '''
+        Returns:
+            The number of advertisements rejected, by reason.
+        '''
+        return dict( zip( FILTER_REASONS, self.rejects ) )
+
+def filterList( values, convert ):
+    '''
+    Turn the value (or values) given for a BLEFilter condition into a tuple, None
+    stays None.
+    '''
+    if values is None:
+        return None
+    if isinstance( values, (list, tuple) ):
+        return tuple( [convert( value ) for value in values] )
+    return ( convert( values ), )
+    
+def filterPrefix( prefix ):
+    '''
+    Turn an address prefix, a hex string that may be separated by colons or
+    dashes, into bytes.
+    '''
+    prefix = bytes.fromhex( prefix.replace( ":", "" ).replace( "-", "" ) )
+    if len(prefix) > 6:
+        raise ValueError( "an address prefix is at most 6 bytes" )
+    return prefix
+    
+def adHasUUID( buf, uuids ):
+    '''
+    Check whether a raw advertisement lists one of the 16 bit service UUIDs, or
+    carries service data for one.  Walked by offset, nothing is allocated.
+    '''
+    size  = len(buf)
+    index = 0
+    while index + 1 < size:
+        length = buf[index]
+        if length == 0:
+            break
+        adType = buf[index+1]
+        start  = index + 2
+        end    = index + length + 1
+        if end > size:
+            end = size
+        if adType == _ADTYPE_SERVICEID or adType == _ADTYPE_SERVICEIDS:
+            while start + 1 < end:
+                if (buf[start] | (buf[start+1] << 8)) in uuids:
+                    return True
+                start += 2
+        elif adType == _ADTYPE_SERVICEDATA and start + 1 < end:
+            if (buf[start] | (buf[start+1] << 8)) in uuids:
+                return True
+        index = end
+    return False
+    
+class ScanRing:
+    '''
+    ScanRing - A fixed size ring buffer of raw scan results.  All of the storage
+    is allocated up front, so that the bluetooth IRQ only has to copy the scan
+    result into the next free slot.  The results are taken back out, decoded and
+    stored by BLEScanner.process outside of the IRQ.
+    
+    If the IRQ finds the ring full, the scan result is dropped and counted in
+    overflow.
+    '''
+    def __init__( self, slots=_RING_SLOTS ):
+        self.slots    = slots
+        self.buffer   = bytearray( slots * _SLOT_SIZE )
+        self.view     = memoryview( self.buffer )
+        self.head     = 0           # next slot the IRQ writes into
+        self.tail     = 0           # next slot to be processed
+        self.received = 0
+        self.overflow = 0
+        
+    def __len__( self ):
+        '''
+        Number of scan results waiting to be processed.
+        '''
+        count = self.head - self.tail
+        if count < 0:
+            count += self.slots
+        return count
+        
+    def put( self, addr_type, addr, adv_type, rssi, adv_data ):
+        '''
+        Copy a scan result into the ring.  Called from the IRQ.
+        
+        Returns:
+            False if the ring was full and the scan result was dropped.
+        '''
+        self.received += 1
+        head = self.head + 1
+        if head == self.slots:
+            head = 0
+        if head == self.tail:
+            self.overflow += 1
+            return False
+        offset = self.head * _SLOT_SIZE
+        length = len(adv_data)
+        if length > _ADV_MAX:
+            length   = _ADV_MAX
+            adv_data = adv_data[:_ADV_MAX]
+        buffer = self.buffer
+        buffer[offset+_SLOT_ADDR_TYPE] = addr_type
+        buffer[offset+_SLOT_ADV_TYPE]  = adv_type
+        buffer[offset+_SLOT_RSSI]      = rssi & 0xFF
+        buffer[offset+_SLOT_LENGTH]    = length
+        self.view[offset+_SLOT_ADDR:offset+_SLOT_DATA] = addr
+        self.view[offset+_SLOT_DATA:offset+_SLOT_DATA+length] = adv_data
+        self.head = head
+        return True
     
 class BLEScanner:
-    def __init__(self, ble, itemFunction):
+    def __init__(self, ble, itemFunction, schedule=False, minInterval=0, maxItems=0, memFloor=0, collect=None):
+        '''
+        Create the scanner.  Scan results are queued by the IRQ and processed later
+        by process(), which the caller should call regularly.  If schedule is True
+        the IRQ also asks micropython.schedule to process them as soon as the IRQ
+        has returned.
+        
+        Parameters:
+            ble          - The bluetooth.BLE object to scan with
+            itemFunction - Function attached to every BLEItem found
+            schedule     - Drain the ring buffer through micropython.schedule
+            minInterval  - Advertisements from a device arriving less than this
+                           many milliseconds after the last one are dropped
+            maxItems     - Most devices kept, see BLEList
+            memFloor     - Free memory below which devices are evicted, see BLEList
+            collect      - Function that runs a collection, see BLEList
+        '''
         self._ble = ble
         self._ble.active(True)
         self._ble.irq(self._irq)
         self._scan_results = None
         self._itemFunction = itemFunction
-        self._filter = None
+        self._filters = None
+        self._reasons = None        # why each filter failed the last advertisement dropped
+        self.filtered = 0           # advertisements dropped by the filters
+        self._ring = ScanRing()
+        self._schedule = schedule
+        self._scheduled = False
+        self._drainRef = self._scheduledDrain
+        self._minInterval = minInterval
+        self._maxItems    = maxItems
+        self._memFloor    = memFloor
+        self._collect     = collect
+        self._scanParams  = (0, False)
+        self.scanning     = False
         
     def __del__():
         self.stop_scan()
@@ -261,16 +876,151 @@ class BLEScanner:
     def _irq(self, event, data):
         if event == _IRQ_SCAN_RESULT:
             addr_type, addr, adv_type, rssi, adv_data = data
-            
-            item = BLEItem( addr_type, addr, adv_type, rssi, adv_data, self._itemFunction )
-            if self._filter is not None:
-                if item.addr == self._filter:
-                    self._scan_results.addItem( item )
-            else:
-                self._scan_results.addItem( item )
+            self._ring.put( addr_type, addr, adv_type, rssi, adv_data )
+            if self._schedule and not self._scheduled:
+                self._scheduled = True
+                try:
+                    micropython.schedule( self._drainRef, None )
+                except RuntimeError:
+                    # The schedule queue is full, process() will pick them up later
+                    self._scheduled = False
         elif event == _IRQ_SCAN_DONE:
             print("Scan complete.")
             
+    def _scheduledDrain( self, arg ):
+        '''
+        Called through micropython.schedule, process one batch and reschedule if
+        there is still more waiting.
+        '''
+        self._scheduled = False
+        if self.process() == _DRAIN_BATCH and len(self._ring) > 0:
+            self._scheduled = True
+            try:
+                micropython.schedule( self._drainRef, None )
+            except RuntimeError:
+                self._scheduled = False
+                
+    def process( self, maxItems=_DRAIN_BATCH ):
+        '''
+        Take up to maxItems scan results out of the ring buffer, decode them and
+        update the scan results list.  This must not be called from the IRQ.
+        
+        Returns:
+            The number of scan results processed.
+        '''
+        ring    = self._ring
+        buffer  = ring.buffer
+        view    = ring.view
+        results = self._scan_results
+        count   = 0
+        while count < maxItems and ring.tail != ring.head:
+            offset = ring.tail * _SLOT_SIZE
+            if results is not None:
+                addr      = view[offset+_SLOT_ADDR:offset+_SLOT_DATA]
+                addr_type = buffer[offset+_SLOT_ADDR_TYPE]
+                rssi      = buffer[offset+_SLOT_RSSI]
+                if rssi > 127:
+                    rssi -= 256
+                length = buffer[offset+_SLOT_LENGTH]
+                adv    = view[offset+_SLOT_DATA:offset+_SLOT_DATA+length]
+                if self._filters is None or self._admit( addr_type, addr, rssi, adv ) or \
+                   results.get( bleKey( addr_type, addr ) ) is not None:
+                    results.upsert( addr_type, addr, buffer[offset+_SLOT_ADV_TYPE], rssi, adv, self._itemFunction )
+                else:
+                    self._reject()
+            tail = ring.tail + 1
+            if tail == ring.slots:
+                tail = 0
+            ring.tail = tail
+            count += 1
+        return count
+    
+    def _admit( self, addr_type, addr, rssi, adv ):
+        '''
+        Check an advertisement against the filters, it is admitted if any of them
+        passes it.  Why each filter failed it is noted for _reject.
+        '''
+        reasons = self._reasons
+        for index in range( len(self._filters) ):
+            reason = self._filters[index].match( addr_type, addr, rssi, adv )
+            if reason < 0:
+                return True
+            reasons[index] = reason
+        return False
+    
+    def _reject( self ):
+        '''
+        Count an advertisement the filters dropped, and why each filter failed it.
+        '''
+        self.filtered += 1
+        reasons = self._reasons
+        for index in range( len(self._filters) ):
+            self._filters[index].rejects[reasons[index]] += 1
+    
+    def setFilters( self, filters ):
+        '''
+        Only add devices that pass one of the filters (BLEFilters) to the scan
+        results, the advertisements of devices that pass none are dropped before
+        anything is allocated for them.  Devices already in the results that pass
+        none are removed, apart from the pinned one; the devices kept go on being
+        updated from every advertisement.
+        
+        Parameters:
+            filters - A list of BLEFilters, or None to admit every device
+        '''
+        if filters is not None and len(filters) == 0:
+            filters = None
+        self._filters = filters
+        self.filtered = 0
+        if filters is not None:
+            self._reasons = bytearray( len(filters) )
+        if filters is not None and self._scan_results is not None:
+            self._scan_results.retain( self._keep )
+            
+    def _keep( self, item ):
+        for bleFilter in self._filters:
+            if bleFilter.matchItem( item ):
+                return True
+        return False
+    
+    def getFilterStats( self ):
+        '''
+        Returns:
+            The number of advertisements the filters dropped, and for each filter
+            the number it rejected by reason (see BLEFilter.stats).
+        '''
+        filters = []
+        if self._filters is not None:
+            filters = [ bleFilter.stats() for bleFilter in self._filters ]
+        return { "filtered" : self.filtered, "filters" : filters }
+    
+    def setMinInterval( self, minInterval ):
+        '''
+        Change the minimum time between advertisements from a device.
+        '''
+        self._minInterval = minInterval
+        if self._scan_results is not None:
+            self._scan_results.minInterval = minInterval
+            
+    def getStats( self ):
+        '''
+        Return the advertisement counters of the current scan (see BLEList), along
+        with the number dropped because the ring buffer was full.
+        '''
+        if self._scan_results is None:
+            stats = BLEList().stats()
+        else:
+            stats = self._scan_results.stats()
+        stats["overflow"] = self._ring.overflow
+        stats["filtered"] = self.filtered
+        return stats
+        
+    def getOverflow( self ):
+        '''
+        Return the number of scan results dropped because the ring buffer was full.
+        '''
+        return self._ring.overflow
+    
     def getMACAddress(self):
         addr = bytes(self._ble.config('mac')[1]).hex()
         return ":".join([addr[i:i+2] for i in range(0, len(addr), 2)] )
@@ -283,19 +1033,37 @@ class BLEScanner:
         :param window_us: Scan window in microseconds.
         :param active: True for active scanning (requests scan response), False for passive.
         """
-        self._scan_results = BLEList()
+        self._scan_results = BLEList( self._minInterval, self._maxItems, self._memFloor, self._collect )
         print(f"Starting BLE scan for {duration_ms}ms...")
         self._ble.gap_scan(duration_ms, interval_us, window_us, active)
+        self.scanning = True
+        self._scanParams = (duration_ms, active)
+        
+    def setDutyCycle( self, interval_us, window_us ):
+        '''
+        Change the scan interval and window.  A scan that is running is restarted
+        with them, keeping the devices already seen.
+        '''
+        if self.scanning:
+            duration_ms, active = self._scanParams
+            self._ble.gap_scan( duration_ms, interval_us, window_us, active )
         
     def setFilter( self, address ):
-        self._filter = address
-        self._scan_results = BLEList()
+        '''
+        Only keep the device with the given address (a hex string), or every device
+        if address is None.  See setFilters.
+        '''
+        if address is None:
+            self.setFilters( None )
+        else:
+            self.setFilters( [ BLEFilter( prefixes=address ) ] )
         
     def get_scan_results(self):
         return self._scan_results
     
     def stop_scan(self):
         self._ble.gap_scan( None )
+        self.scanning = False
 
 def makeAscii( data ):
     n = 2
@@ -331,7 +1099,8 @@ if __name__ == "__main__":
    
     count = 0
     while count < 20000:
-        print( f"memory: {gc.mem_alloc()}" )
+        scanner.process( _RING_SLOTS )
+        print( f"memory: {gc.mem_alloc()} stats: {scanner.getStats()}" )
         time.sleep( 1 )
         count += 1  
     
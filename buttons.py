@@ -0,0 +1,220 @@
+#
+# Buttons - the buttons of the Display Pack, read by pin interrupts.
+#
+# Every edge on a button's pin is timestamped by the interrupt handler into a small ring
+# of preallocated arrays, so nothing is allocated in the handler and no press is lost
+# while the application is busy elsewhere (a blocking wifi scan, say).  The edges are
+# turned into events by process(), which the buttons task runs whenever the handler
+# wakes it, and otherwise sleeps until the next hold or repeat falls due.
+#
+# Bounces are filtered in software: an edge that comes within debounce_ms of the last
+# change accepted for a button is dropped, and once a button has settled its pin is read
+# again, in case the last edge of a bounce was one of those dropped.
+#
+# Each button works in one of three modes:
+#
+#   BUTTON_PRESS  - The event is posted as soon as the button is pressed
+#   BUTTON_REPEAT - The event is posted as soon as the button is pressed, and again
+#                   after repeat_delay_ms and every repeat_ms after that while it is held
+#   BUTTON_LONG   - The event is posted when the button is released, or the long event
+#                   instead once it has been held for long_ms
+#
+import time
+import asyncio
+
+from array import array
+from machine import Pin
+from micropython import const
+
+BUTTON_PRESS  = const(0)
+BUTTON_REPEAT = const(1)
+BUTTON_LONG   = const(2)
+
+DEBOUNCE_MS     = 20            # edges this soon after a change are bounces
+LONG_MS         = 800           # hold before a long press
+REPEAT_DELAY_MS = 400           # hold before the first repeat
+REPEAT_MS       = 80            # time between repeats
+QUEUE_SIZE      = 16            # edges waiting for process(), beyond this they are dropped
+
+class Buttons:
+    '''
+    Buttons - The buttons, their interrupt handlers and the edge queue.  Buttons are
+    active low, pulled up, and numbered in the order they are added.
+    '''
+    def __init__( self, queueSize=QUEUE_SIZE, debounce_ms=DEBOUNCE_MS, long_ms=LONG_MS,
+                  repeatDelay_ms=REPEAT_DELAY_MS, repeat_ms=REPEAT_MS ):
+        '''
+        Parameters:
+            queueSize      - Number of edges the queue holds
+            debounce_ms    - Edges this soon after a change are bounces
+            long_ms        - Hold before a long press
+            repeatDelay_ms - Hold before the first repeat
+            repeat_ms      - Time between repeats
+        '''
+        self.debounce    = debounce_ms
+        self.long        = long_ms
+        self.repeatDelay = repeatDelay_ms
+        self.repeat      = repeat_ms
+        self.pins        = []
+        self.modes       = []
+        self.events      = []
+        self.longEvents  = []
+        self.down        = []       # debounced state, True while pressed
+        self.changed     = []       # ticks_ms of the last change accepted
+        self.due         = []       # ticks_ms the next repeat or long press is due
+        self.held        = []       # long press posted for this press
+        self.edgeTimes   = array( 'L', [0] * queueSize )
+        self.edgeButtons = bytearray( queueSize )
+        self.edgeLevels  = bytearray( queueSize )
+        self.size        = queueSize
+        self.head        = 0        # written by the handler
+        self.tail        = 0        # read by process()
+        self.flag        = asyncio.ThreadSafeFlag()
+        self.post        = None
+        self.edges       = 0        # edges queued
+        self.overflow    = 0        # edges dropped, the queue was full
+        self.bounces     = 0        # edges dropped as bounces
+        self.presses     = 0        # presses accepted
+        self.repeats     = 0        # repeat events posted
+        self.longPresses = 0        # long events posted
+
+    def add( self, pin, mode, event, longEvent=None ):
+        '''
+        Add a button.
+
+        Parameters:
+            pin       - GPIO the button is on
+            mode      - BUTTON_PRESS, BUTTON_REPEAT or BUTTON_LONG
+            event     - Event posted for a press (or a repeat)
+            longEvent - Event posted for a long press, BUTTON_LONG only
+
+        Returns:
+            The number of the button.
+        '''
+        index = len(self.pins)
+        pin = Pin( pin, Pin.IN, Pin.PULL_UP )
+        self.pins.append( pin )
+        self.modes.append( mode )
+        self.events.append( event )
+        self.longEvents.append( longEvent )
+        self.down.append( False )
+        self.changed.append( time.ticks_add( time.ticks_ms(), -self.debounce ) )
+        self.due.append( 0 )
+        self.held.append( False )
+        pin.irq( lambda p, i=index: self._edge( i, p ), Pin.IRQ_FALLING | Pin.IRQ_RISING )
+        return index
+
+    def _edge( self, index, pin ):
+        '''
+        Interrupt handler, queue the edge and wake the buttons task.  Allocates nothing.
+        '''
+        head = self.head
+        after = head + 1
+        if after == self.size:
+            after = 0
+        if after == self.tail:
+            self.overflow += 1
+        else:
+            self.edgeTimes[head]   = time.ticks_ms()
+            self.edgeButtons[head] = index
+            self.edgeLevels[head]  = pin.value()
+            self.head   = after
+            self.edges += 1
+        self.flag.set()
+
+    def isDown( self, index ):
+        '''
+        Returns:
+            True while the button is held down, after debouncing.
+        '''
+        return self.down[index]
+
+    def _change( self, index, pressed, ticks ):
+        '''
+        Accept a change of a button to pressed (or released) at ticks, unless it is
+        no change at all or a bounce, and post the events it causes.
+        '''
+        if pressed == self.down[index]:
+            return
+        if time.ticks_diff( ticks, self.changed[index] ) < self.debounce:
+            self.bounces += 1
+            return
+        self.down[index]    = pressed
+        self.changed[index] = ticks
+        mode = self.modes[index]
+        if pressed:
+            self.presses += 1
+            if mode == BUTTON_LONG:
+                self.held[index] = False
+                self.due[index]  = time.ticks_add( ticks, self.long )
+            else:
+                self.post( self.events[index], False )
+                if mode == BUTTON_REPEAT:
+                    self.due[index] = time.ticks_add( ticks, self.repeatDelay )
+        elif mode == BUTTON_LONG and not self.held[index]:
+            self.post( self.events[index], False )
+
+    def process( self, now ):
+        '''
+        Turn the queued edges into events, then post the repeats and long presses
+        that have fallen due.
+
+        Returns:
+            Milliseconds until something is next due, or None if nothing is.
+        '''
+        while self.tail != self.head:
+            tail = self.tail
+            self._change( self.edgeButtons[tail], self.edgeLevels[tail] == 0, self.edgeTimes[tail] )
+            tail += 1
+            self.tail = 0 if tail == self.size else tail
+        wait = None
+        for index in range( len(self.pins) ):
+            since = time.ticks_diff( now, self.changed[index] )
+            if since < self.debounce:
+                left = self.debounce - since
+                wait = left if wait is None or left < wait else wait
+            else:
+                self._change( index, self.pins[index].value() == 0, now )
+            mode = self.modes[index]
+            if not self.down[index] or mode == BUTTON_PRESS or self.held[index]:
+                continue
+            left = time.ticks_diff( self.due[index], now )
+            if left <= 0:
+                if mode == BUTTON_LONG:
+                    self.held[index] = True
+                    self.longPresses += 1
+                    self.post( self.longEvents[index], False )
+                    continue
+                self.repeats += 1
+                self.post( self.events[index], True )
+                self.due[index] = time.ticks_add( now, self.repeat )
+                left = self.repeat
+            wait = left if wait is None or left < wait else wait
+        return wait
+
+    async def run( self, post ):
+        '''
+        The buttons task: sleep until an edge comes in or a hold falls due, and post
+        the events.
+
+        Parameters:
+            post - Called with each event, and True if the event is a repeat
+        '''
+        self.post = post
+        while True:
+            wait = self.process( time.ticks_ms() )
+            if wait is None:
+                await self.flag.wait()
+            else:
+                try:
+                    await asyncio.wait_for( self.flag.wait(), wait / 1000 )
+                except asyncio.TimeoutError:
+                    pass
+
+    def stats( self ):
+        return { "edges"       : self.edges,
+                 "overflow"    : self.overflow,
+                 "bounces"     : self.bounces,
+                 "presses"     : self.presses,
+                 "repeats"     : self.repeats,
+                 "longPresses" : self.longPresses }
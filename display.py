@@ -4,22 +4,55 @@
 
 from picographics import PicoGraphics, DISPLAY_PICO_DISPLAY_2, PEN_P8, PEN_P4
 from pimoroni import RGBLED
-from pimoroni import Button
 from machine import Pin
 from batterystate import BatteryState
+from buttons import Buttons, BUTTON_PRESS, BUTTON_REPEAT, BUTTON_LONG
+import asyncio
 import time
-import gc
 
 from displayhelper import *
 
 TEXT_HEIGHT = 18
 BACKGROUND = 2
 
-button_a = Button(12)
-button_b = Button(13)
-button_x = Button(14)
-button_y = Button(15)
-    
+class TextCache:
+    '''
+    A small cache of the strings drawn on the display: the tab separated segments
+    of each string and, once measured, its width.  The cache is an approximate
+    LRU made of two generations; when the current generation fills up it becomes
+    the old one, and anything still in use is promoted back as it is found, so
+    strings not drawn for a while drop out.  This avoids relying on dict order or
+    OrderedDict.move_to_end, neither of which MicroPython has.
+    '''
+    def __init__( self, size=64 ):
+        self.size     = size
+        self.current  = {}
+        self.previous = {}
+        self.hits     = 0
+        self.misses   = 0
+        
+    def get( self, message ):
+        '''
+        Returns:
+            The cache entry for a string, [segments, width], the width being None
+            until it has been measured.
+        '''
+        entry = self.current.get( message )
+        if entry is not None:
+            self.hits += 1
+            return entry
+        entry = self.previous.get( message )
+        if entry is None:
+            self.misses += 1
+            entry = [message.split( '\t' ), None]
+        else:
+            self.hits += 1
+        if len(self.current) >= self.size:
+            self.previous = self.current
+            self.current  = {}
+        self.current[message] = entry
+        return entry
+        
 class Panel:
     def __init__( self, display, title ):
         '''
@@ -98,32 +131,145 @@ class Panel:
         self.display.textAtClear( line )
     
 class ListBoxPanel(Panel):
+    REFRESH_MS = 1000           # How often asyncFunc is called while the list box is shown
+    REFRESH_MAX_MS = 4000       # ... backing off to this while the refreshes change nothing
+    
     def __init__( self, display, title ):
         super().__init__( display, title )
-        self.itemList = []
+        self.model    = ListModel()
         self.tabs     = []
         self.maxTextEntries = ((self.height - self.starty) // Display.TEXT_HEIGHT)+2
+        self.rows     = [None] * self.maxTextEntries    # [item, version, text, color] last drawn in each row
+        self.dirtyTop = -1                              # rows drawn but not yet pushed
+        self.dirtyEnd = -1
            
     def setList( self, itemList, tabs=None ):
-        self.itemList = itemList
+        '''
+        Set what the list box shows.
+        
+        Parameters:
+            itemList - A ListModel, or a plain list of items which is wrapped in one
+            tabs     - Tab stops for the columns of the rows
+        '''
+        self.setModel( itemList )
         if tabs is not None:
             self.tabs = tabs
+            self.invalidate()
+            
+    def setModel( self, model ):
+        '''
+        Switch to a different model, the rows that do not change are not repainted.
+        '''
+        if not isinstance( model, ListModel ):
+            model = ListModel( model )
+        self.model = model
+        
+    def invalidate( self ):
+        '''
+        Forget what has been drawn in the rows, so the next fillListBox draws all of
+        them.  Needed whenever something else has drawn over the list box.
+        '''
+        for row in range( self.maxTextEntries ):
+            self.rows[row] = None
+            
+    def displayPanel( self, update=True ):
+        self.invalidate()
+        super().displayPanel( update )
+        
+    def clearPanel( self, update=True ):
+        self.invalidate()
+        super().clearPanel( update )
+            
+    def _rowArea( self, row ):
+        '''
+        Return the y position and height of a row, clipped to the panel.
+        '''
+        ypos   = self.starty + (row * TEXT_HEIGHT)
+        height = TEXT_HEIGHT
+        if ypos + height > self.starty + self.height:
+            height = self.starty + self.height - ypos
+        return ypos, height
+        
+    def _markDirty( self, row ):
+        '''
+        Remember that a row has been drawn, so that flush() pushes it to the panel.
+        '''
+        if self.dirtyTop < 0 or row < self.dirtyTop:
+            self.dirtyTop = row
+        if row >= self.dirtyEnd:
+            self.dirtyEnd = row + 1
+            
+    def flush( self ):
+        '''
+        Push the rows drawn since the last flush to the panel, or nothing at all if
+        no row has changed.
+        '''
+        if self.dirtyTop < 0:
+            self.display.skipUpdate()
+            return
+        ypos, height = self._rowArea( self.dirtyTop )
+        bottom, last = self._rowArea( self.dirtyEnd - 1 )
+        height = bottom + last - ypos
+        self.dirtyTop = -1
+        self.dirtyEnd = -1
+        if height > 0:
+            self.display.updateRegion( BACKGROUND, ypos, self.display.listWidth, height )
         
     def fillListBox( self, start, update=True ):
-        self.display.set_pen( Display.GREY )
+        '''
+        Draw the items from start onwards into the rows of the list box.  Only the
+        rows on screen are asked of the model.  A row holding the same item at the
+        same version as last time is not even formatted, and only rows whose text or
+        color differ from what was drawn last time are repainted.
+        
+        Parameters:
+            start  - Index of the item shown in the first row
+            update - Push the repainted rows to the panel
+            
+        Returns:
+            The number of rows repainted.
+        '''
         xOffset = self.startx
-        yOffset = self.starty
-        count = 0
-        for i in range( start, len(self.itemList), 1 ):
-            item = self.itemList[i]
-            self.display.set_pen( item.getColor() )
-            self.display.text( str(item), xOffset, yOffset, tabs=self.tabs )
-            yOffset += TEXT_HEIGHT
-            if count >= self.maxTextEntries-1:
-                break
-            count += 1
+        redrawn = 0
+        model   = self.model
+        count   = model.rowCount()
+        for row in range( self.maxTextEntries ):
+            index = start + row
+            drawn = self.rows[row]
+            if index < count:
+                item    = model.rowItem( index )
+                version = model.rowVersion( index )
+                if drawn is not None and version is not None and \
+                   drawn[0] is item and drawn[1] == version:
+                    continue
+                self.display.rowsFormatted += 1
+                text  = model.rowText( index )
+                color = model.rowColor( index )
+                if drawn is not None and drawn[2] == text and drawn[3] == color:
+                    # Same on screen, remember the new item and version in place
+                    drawn[0] = item
+                    drawn[1] = version
+                    continue
+                content = [item, version, text, color]
+            elif drawn is None:
+                continue
+            else:
+                content = None
+            ypos, height = self._rowArea( row )
+            if height <= 0:
+                continue
+            self.display.set_pen( Display.BLACK )
+            self.display.rectangle( BACKGROUND, ypos, self.display.listWidth, height )
+            if content is not None:
+                self.display.set_pen( content[3] )
+                self.display.text( content[2], xOffset, ypos, tabs=self.tabs )
+            self.rows[row] = content
+            self._markDirty( row )
+            redrawn += 1
+        self.display.rowsRedrawn += redrawn
         if update:
-            self.display.update()
+            self.flush()
+        return redrawn
             
     def displaySelector( self, line, color, update=True):
         self.display.set_pen( color )
@@ -135,14 +281,77 @@ class ListBoxPanel(Panel):
         self.display.line(stopx,  starty, stopx,  stopy  )
         self.display.line(stopx,  stopy,  startx, stopy  )
         self.display.line(startx, stopy,  startx, starty )
+        self._markDirty( line )
         if update:
-            self.display.update()
+            self.flush()
             
     def clearListBox(self):
         self.display.set_pen( Display.BLACK )
         self.display.rectangle( BACKGROUND, self.starty, self.display.listWidth, self.height)
+        self.invalidate()
+        
+    def refresh( self, start, line, moved=False ):
+        '''
+        Repaint whatever rows changed, put the selector back if its row was repainted
+        (or it moved to another line) and push the changed rows to the panel.
+        '''
+        before = self.rows[line]
+        redrawn = self.fillListBox( start, False )
+        if moved or self.rows[line] is not before:
+            self.displaySelector( line, Display.RED, False )
+        self.flush()
+        return redrawn
+        
+    def selectedKey( self, start, line ):
+        '''
+        Returns:
+            The key of the item under the selector, or None if there is none.
+        '''
+        if start + line < self.model.rowCount():
+            return self.model.rowKey( start + line )
+        return None
         
-    def draw( self, asyncFunc=None ):
+    def anchor( self, key, start, line ):
+        '''
+        Work out where the selected item is after the list changed, and the start
+        that keeps it on the same line of the list box, or as near as the length of
+        the list allows.  If the item has gone the selector stays where it was.
+        
+        Parameters:
+            key   - Key of the selected item, see selectedKey
+            start - Index of the item that was shown in the first row
+            line  - Line the selector was on
+            
+        Returns:
+            The new start and line.
+        '''
+        count = self.model.rowCount()
+        if count == 0:
+            return 0, 0
+        index = -1
+        if key is not None:
+            index = self.model.rowIndex( key, start + line )
+        if index < 0:
+            index = min( start + line, count - 1 )
+        start = min( index - line, count - self.maxTextEntries )
+        if start < 0:
+            start = 0
+        return start, index - start
+        
+    async def draw( self, asyncFunc=None ):
+        '''
+        Display the list box and let the user pick an item from it.  The list box
+        waits for button events, so nothing runs while the user does nothing, and
+        refreshes less often while the refreshes find nothing has changed.
+        Holding up or down scrolls, holding select goes back to the top.
+        
+        Parameters:
+            asyncFunc - If given, called about once a second (or whenever a
+                        EVENT_DATA is posted) to obtain a refreshed list.
+                        
+        Returns:
+            The item selected, or None if cancel was pressed.
+        '''
         self.displayPanel(False)
         #self.clearListBox()
         
@@ -150,53 +359,184 @@ class ListBoxPanel(Panel):
         self.fillListBox(start,False)
         waiting = True
         line = 0
-        self.displaySelector(line, Display.RED)
+        self.displaySelector(line, Display.RED, False)
+        self.dirtyTop = -1
+        self.dirtyEnd = -1
+        self.display.update()
         
         item = None
-        count = 0
+        key = self.selectedKey( start, line )
+        refresh = time.ticks_ms()
+        interval = ListBoxPanel.REFRESH_MS
         while waiting:
-            if asyncFunc and (count % 10) == 0:
-                # Once a second check check the async function...
-                self.itemList = asyncFunc()
-                self.clearListBox()
-                self.fillListBox( start, False )
-                self.displaySelector( line, Display.RED )
-                gc.collect()
-            if self.display.getUpButton():
+            timeout = None
+            if asyncFunc:
+                timeout = interval - time.ticks_diff( time.ticks_ms(), refresh )
+                if timeout < 0:
+                    timeout = 0
+            event = await self.display.waitEvent( timeout )
+            if event is None or event == EVENT_DATA:
+                if asyncFunc:
+                    # Once a second check check the async function...
+                    refresh = time.ticks_ms()
+                    self.setModel( asyncFunc() )
+                    # Keep the selector on the same item, wherever it went
+                    start, newLine = self.anchor( key, start, line )
+                    moved = newLine != line
+                    if moved:
+                        self.displaySelector( line, Display.BLACK, False )
+                        line = newLine
+                    if self.refresh( start, line, moved ) or moved:
+                        interval = ListBoxPanel.REFRESH_MS
+                    elif interval < ListBoxPanel.REFRESH_MAX_MS:
+                        interval *= 2
+                    key = self.selectedKey( start, line )
+                continue
+            interval = ListBoxPanel.REFRESH_MS
+            if event == EVENT_UP:
                 if line > 0:
                     self.displaySelector( line, Display.BLACK, False )
                     line -= 1
                     self.displaySelector( line, Display.RED )
                 elif start > 0:
                     start -= 1
-                    self.clearListBox()
-                    self.fillListBox( start, False )
-                    self.displaySelector( line, Display.RED )
-            elif self.display.getDownButton():
-                if line < self.maxTextEntries-1 and line < len(self.itemList)-1:
+                    self.refresh( start, line )
+                key = self.selectedKey( start, line )
+            elif event == EVENT_DOWN:
+                if line < self.maxTextEntries-1 and line < self.model.rowCount()-1:
                     self.displaySelector( line, Display.BLACK, False )
                     line += 1
                     self.displaySelector( line, Display.RED )
-                elif len(self.itemList)-start > self.maxTextEntries:
+                elif self.model.rowCount()-start > self.maxTextEntries:
                     start += 1
-                    self.clearListBox()
-                    self.fillListBox( start, False )
-                    self.displaySelector( line, Display.RED )
-            elif self.display.getSelButton():
-                if (line+start) < len(self.itemList):
-                    item = self.itemList[line+start]
+                    self.refresh( start, line )
+                key = self.selectedKey( start, line )
+            elif event == EVENT_LONG_SELECT:
+                # Back to the top of the list
+                if start or line:
+                    self.displaySelector( line, Display.BLACK, False )
+                    start, line = 0, 0
+                    self.refresh( start, line, True )
+                    key = self.selectedKey( start, line )
+            elif event == EVENT_SELECT:
+                if (line+start) < self.model.rowCount():
+                    item = self.model.rowItem( line+start )
                 else:
                     print( 'Select pressed - item out of range' )
                     item = None
                 waiting = False
-            elif self.display.getCancelButton():
+            elif event == EVENT_CANCEL:
                 print( 'Cancel Pressed' )
                 item = None
                 waiting = False
-            count += 1
-            time.sleep( 0.1 )
         return item   
         
+class Graph:
+    '''
+    A scrolling bar graph of the RSSI history of a device.  Samples are placed by
+    their age, the right hand edge being now and the left hand edge window_ms ago,
+    so the trace scrolls left as time passes.  Each sample is drawn as a bar from
+    where it was taken up to the next sample (the latest up to now), in the color
+    of its own signal strength.  Lines and labels mark the minimum, average and
+    maximum RSSI seen within the window.
+    
+    The whole graph is redrawn from the history in one pass, and only the graph
+    region is pushed to the panel.
+    '''
+    LOW  = -100                 # RSSI at the bottom of the graph
+    HIGH = -20                  # RSSI at the top of the graph
+    
+    def __init__( self, display, x, y, width, height, window_ms ):
+        '''
+        Parameters:
+            display       - The Display to draw on
+            x, y          - Top left corner of the graph
+            width, height - Size of the graph
+            window_ms     - The time span shown across the graph
+        '''
+        self.display = display
+        self.x       = x
+        self.y       = y
+        self.width   = width
+        self.height  = height
+        self.window  = window_ms
+        
+    def setWindow( self, window_ms ):
+        '''
+        Change the time span shown across the graph.
+        '''
+        self.window = window_ms
+        
+    def _ypos( self, rssi ):
+        if rssi < Graph.LOW:
+            rssi = Graph.LOW
+        elif rssi > Graph.HIGH:
+            rssi = Graph.HIGH
+        return self.y + self.height - ((rssi - Graph.LOW) * self.height) // (Graph.HIGH - Graph.LOW)
+    
+    def _xpos( self, age ):
+        xpos = self.x + self.width - (age * self.width) // self.window
+        if xpos < self.x:
+            xpos = self.x
+        return xpos
+    
+    def _overlay( self, value, color ):
+        ypos = self._ypos( value )
+        self.display.set_pen( color )
+        self.display.line( self.x, ypos, self.x + self.width, ypos )
+        self.display.text( f"{value}", self.x + 2, ypos - 9, self.width, scale=1 )
+        
+    def draw( self, history, update=True ):
+        '''
+        Draw the graph.
+        
+        Parameters:
+            history - The RSSIHistory of the device
+            update  - Push the graph region to the panel
+            
+        Returns:
+            The minimum, average and maximum RSSI within the window, or None if
+            there are no samples within it.
+        '''
+        display = self.display
+        bottom  = self.y + self.height
+        display.set_pen( Display.BLACK )
+        display.rectangle( self.x, self.y, self.width, self.height )
+        right = self.x + self.width
+        low   = 0
+        high  = 0
+        total = 0
+        count = 0
+        index = len(history) - 1
+        while index >= 0 and right > self.x:
+            age  = history.age( index )
+            rssi = history.sample( index )
+            left = self._xpos( age )
+            if index == len(history) - 1 and right - left < 2:
+                left = right - 2
+            if left < right:
+                ypos = self._ypos( rssi )
+                display.set_pen( rssiColor( rssi ) )
+                display.rectangle( left, ypos, right - left, bottom - ypos )
+                right = left
+            if age <= self.window:
+                if count == 0 or rssi < low:
+                    low = rssi
+                if count == 0 or rssi > high:
+                    high = rssi
+                total += rssi
+                count += 1
+            index -= 1
+        stats = None
+        if count:
+            stats = (low, total // count, high)
+            self._overlay( high,  Display.GREY )
+            self._overlay( low,   Display.GREY )
+            self._overlay( stats[1], Display.BLUE )
+        if update:
+            display.updateRegion( self.x, self.y, self.width, self.height )
+        return stats
+        
 class Display:
     '''
     Display class.  This class exposes a number of functions that create graphics
@@ -242,6 +582,10 @@ class Display:
     TEXT_YOFFSET = BACKGROUND+2
     TEXT_HEIGHT  = TEXT_HEIGHT
     
+    BYTES_PER_PIXEL = 2         # The panel is sent RGB565, whatever the pen type
+    PARTIAL_UPDATE = False      # Push regions with partial_update, not yet confirmed on the Display Pack 2's ST7789
+    MAX_EVENTS     = 8          # Events queued beyond this are dropped
+    
     def __init__(self):
         '''
         Initialize the display class.  This class provides a number of function.
@@ -267,45 +611,64 @@ class Display:
         self.panelPen   = self.display.create_pen(  0,   0, 128)
         self.yellowPen  = self.display.create_pen(255, 255,   0)
         self.orangePen  = self.display.create_pen(255, 165,   0)
+        #
+        # Indexed by the COLOR_* values
+        #
+        self.pens       = [ self.blackPen, self.greyPen,  self.GreenPen,  self.RedPen,
+                            self.BluePen,  self.panelPen, self.yellowPen, self.orangePen ]
+        self.pen        = None
+        self.textCache  = TextCache()
         
         self.led        = RGBLED(6, 7, 8)
         self.led.set_rgb( 0, 0, 0 )
         #
-        self.button_up  = Button(12)
-        self.button_dwn = Button(13)
-        self.button_x   = Button(14)
-        self.button_y   = Button(15)
+        self.buttons    = Buttons()
+        self.buttons.add( 12, BUTTON_REPEAT, EVENT_UP )
+        self.buttons.add( 13, BUTTON_REPEAT, EVENT_DOWN )
+        self.buttons.add( 14, BUTTON_LONG,   EVENT_SELECT, EVENT_LONG_SELECT )
+        self.buttons.add( 15, BUTTON_PRESS,  EVENT_CANCEL )
         #   
         self.set_backlight( 0.8 )
         self.maxTextEntries = (self.listHeight - BACKGROUND + 2)//TEXT_HEIGHT
+        #
+        self.events     = []
+        self.eventFlag  = asyncio.Event()
+        self.idleHook   = None
+        self.activityHook = None
+        self.refreshScale = 1       # timed refreshes are stretched by this, see waitEvent
+        self.blanked    = False     # backlight off, nothing is pushed to the panel
+        #
+        self.frames         = 0     # frame instrumentation, see frameStats
+        self.framesSkipped  = 0
+        self.frameRows      = 0
+        self.frameBytes     = 0
+        self.rowsRedrawn    = 0
+        self.rowsFormatted  = 0     # list rows whose text was asked of the model
+        self.bytesPushed    = 0
+        self._frameStartRows = 0
+        self.texts          = 0     # text primitives issued
+        self.penSwitches    = 0     # pen changes issued
+        self.frameTexts     = 0
+        self.framePens      = 0
+        self._frameStartTexts = 0
+        self._frameStartPens  = 0
                      
     def set_pen( self, pen ):
         '''
         Set the pen to a new color.  We use the defined constant colors in the
         Display class to determine which pen should be used.  This makes it so
-        no other code needs to know what the PEN object type is.
+        no other code needs to know what the PEN object type is.  Setting the pen
+        that is already set costs nothing.
         
         Parameters:
             pen    - Which color value do we want to set the pen to
-            
-        Note:  Micropython does not yet support match/case syntax.
-        '''
-        if pen == Display.BLACK:
-            self.display.set_pen( self.blackPen )
-        elif pen == Display.GREY:
-            self.display.set_pen( self.greyPen )
-        elif pen == Display.GREEN:
-            self.display.set_pen( self.GreenPen )
-        elif pen == Display.RED:
-            self.display.set_pen( self.RedPen )
-        elif pen == Display.BLUE:
-            self.display.set_pen( self.BluePen )
-        elif pen == Display.PANEL:
-            self.display.set_pen( self.panelPen )
-        elif pen == Display.YELLOW:
-            self.display.set_pen( self.yellowPen )
-        elif pen == Display.ORANGE:
-            self.display.set_pen( self.orangePen )
+        '''
+        if pen == self.pen:
+            return
+        self.pen = pen
+        self.penSwitches += 1
+        if 0 <= pen < len(self.pens):
+            self.display.set_pen( self.pens[pen] )
         else:
             self.display.set_pen( self.BluePen )
         
@@ -323,37 +686,144 @@ class Display:
         self.display.set_backlight(value)
         
     def update(self):
+        '''
+        Push the whole display buffer to the panel.
+        '''
+        if self.blanked:
+            self.skipUpdate()
+            return
         self.display.update()
+        self._endFrame( self.width * self.height * Display.BYTES_PER_PIXEL )
         
-    def text( self, message, x, y, width=0, tabs=None):
-        if width == 0:
-            width = self.listWidth
+    def updateRegion( self, x, y, width, height ):
+        '''
+        Push only part of the display buffer to the panel.  Unless PARTIAL_UPDATE
+        is turned on the whole buffer is pushed instead, as a PicoGraphics build
+        may have partial_update and still push nothing to this panel.
+        
+        Parameters:
+            x, y          - Top left corner of the region
+            width, height - Size of the region
+        '''
+        if self.blanked:
+            self.skipUpdate()
+        elif Display.PARTIAL_UPDATE:
+            self.display.partial_update( x, y, width, height )
+            self._endFrame( width * height * Display.BYTES_PER_PIXEL )
+        else:
+            self.update()
+            
+    def updateLines( self, line, count=1 ):
+        '''
+        Push only some of the text lines written by textAt to the panel.
+        
+        Parameters:
+            line  - The first line
+            count - The number of lines
+        '''
+        ypos = self.TEXT_YOFFSET + (line * self.TEXT_HEIGHT)
+        self.updateRegion( BACKGROUND, ypos, self.listWidth, count * self.TEXT_HEIGHT )
+        
+    def blank( self ):
+        '''
+        Stop pushing to the panel, called once the backlight is off.  Drawing still
+        goes to the display buffer.
+        '''
+        self.blanked = True
+        
+    def unblank( self ):
+        '''
+        Push to the panel again, starting with the whole display buffer as nothing
+        drawn while blanked reached the panel.
+        '''
+        self.blanked = False
+        self.update()
+        
+    def skipUpdate( self ):
+        '''
+        Called instead of update when nothing has changed, so the frame is still
+        counted.
+        '''
+        self.framesSkipped += 1
+        self._endFrame( 0 )
+        
+    def _endFrame( self, pushed ):
+        '''
+        Bookkeeping for the frame instrumentation, see frameStats.
+        '''
+        self.frames       += 1
+        self.bytesPushed  += pushed
+        self.frameBytes    = pushed
+        self.frameRows     = self.rowsRedrawn - self._frameStartRows
+        self._frameStartRows = self.rowsRedrawn
+        self.frameTexts    = self.texts - self._frameStartTexts
+        self._frameStartTexts = self.texts
+        self.framePens     = self.penSwitches - self._frameStartPens
+        self._frameStartPens  = self.penSwitches
+        
+    def frameStats( self ):
+        '''
+        Return the instrumentation counters: the rows repainted, the text primitives
+        and pen switches issued and the bytes pushed to the panel by the last frame,
+        and the totals since the display was created.
+        '''
+        return { "frames"          : self.frames,
+                 "framesSkipped"   : self.framesSkipped,
+                 "frameRows"       : self.frameRows,
+                 "frameBytes"      : self.frameBytes,
+                 "frameTexts"      : self.frameTexts,
+                 "framePens"       : self.framePens,
+                 "rowsRedrawn"     : self.rowsRedrawn,
+                 "rowsFormatted"   : self.rowsFormatted,
+                 "bytesPushed"     : self.bytesPushed,
+                 "texts"           : self.texts,
+                 "penSwitches"     : self.penSwitches,
+                 "textCacheHits"   : self.textCache.hits,
+                 "textCacheMisses" : self.textCache.misses }
+        
+    def _text( self, message, x, y, width, scale, tabs ):
+        '''
+        Draw a string, each tab separated segment at its tab position.  The
+        segments come from the text cache, so a string is only split once.
+        '''
         if tabs is None or len(tabs) == 0:
-            self.display.text( message, x, y, width, 2, fixed_width=False )
+            self.texts += 1
+            self.display.text( message, x, y, width, scale, fixed_width=False )
         else:
-            strings = message.split( '\t' )
-            for i,msg in enumerate(strings):
-                self.display.text( msg, x+tabs[i], y, width, 2, fixed_width=False )
+            for i,msg in enumerate( self.textCache.get( message )[0] ):
+                self.texts += 1
+                self.display.text( msg, x+tabs[i], y, width, scale, fixed_width=False )
+                
+    def measure( self, message ):
+        '''
+        Returns:
+            The width of a string at the normal text scale, measured once and then
+            taken from the text cache.
+        '''
+        entry = self.textCache.get( message )
+        if entry[1] is None:
+            entry[1] = self.display.measure_text( message, 2 )
+        return entry[1]
+        
+    def text( self, message, x, y, width=0, tabs=None, scale=2 ):
+        if width == 0:
+            width = self.listWidth
+        self._text( message, x, y, width, scale, tabs )
             
     def textAt( self, message, line, tabs=None, wrap=True ):
         if wrap:
             width = self.listWidth - 2
         else:
-            width = self.display.measure_text( message, 2 ) + 10
+            width = self.measure( message ) + 10
         xpos  = self.TEXT_XOFFSET
         ypos  = self.TEXT_YOFFSET + (line * self.TEXT_HEIGHT)
-        if tabs is None or len(tabs) == 0:
-            self.display.text( message, xpos, ypos, width, 2, fixed_width=False )
-        else:
-            strings = message.split( '\t' )
-            for i,msg in enumerate(strings):
-                self.display.text( msg, xpos+tabs[i], ypos, width, 2, fixed_width=False )
+        self._text( message, xpos, ypos, width, 2, tabs )
 
     def textAtClear( self, line ):
         width = self.listWidth - self.TEXT_XOFFSET
         xpos  = self.TEXT_XOFFSET
         ypos  = self.TEXT_YOFFSET + (line * self.TEXT_HEIGHT)
-        self.display.set_pen( self.blackPen )
+        self.set_pen( Display.BLACK )
         self.display.rectangle( xpos, ypos, width, self.TEXT_HEIGHT)
         
     def rectangle( self, xstart, ystart, xend, yend ):
@@ -362,17 +832,68 @@ class Display:
     def line( self, xstart, ystart, xend, yend):
         self.display.line( xstart, ystart, xend, yend)
         
-    def getCancelButton(self):
-        return self.button_y.read()
-    
-    def getUpButton( self ):
-        return self.button_up.read()
+    def post( self, event, repeat=False ):
+        '''
+        Queue an event for whoever is waiting in waitEvent.
+        
+        Parameters:
+            event  - One of the EVENT_* values
+            repeat - The event is a button repeat, dropped unless the queue is empty
+                     so that scrolling stops when the button is let go
+        '''
+        if repeat and len(self.events):
+            return
+        if event != EVENT_DATA and self.activityHook is not None and self.activityHook():
+            return
+        if len(self.events) < Display.MAX_EVENTS:
+            self.events.append( event )
+        self.eventFlag.set()
+        
+    async def waitEvent( self, timeout_ms=None ):
+        '''
+        Wait for the next event, either a button press or an EVENT_DATA posted by
+        one of the background tasks.  The timeout is stretched by refreshScale, so
+        the screens that redraw on a timer redraw less often to save power.
+        
+        Parameters:
+            timeout_ms - How long to wait, None waits until there is an event
+            
+        Returns:
+            The event, or None if the timeout expired first.
+        '''
+        if len(self.events) == 0:
+            if self.idleHook is not None:
+                self.idleHook()
+            self.eventFlag.clear()
+            try:
+                if timeout_ms is None:
+                    await self.eventFlag.wait()
+                else:
+                    await asyncio.wait_for( self.eventFlag.wait(), timeout_ms * self.refreshScale / 1000 )
+            except asyncio.TimeoutError:
+                return None
+        return self.events.pop( 0 )
     
-    def getDownButton( self ):
-        return self.button_dwn.read()
+    def setIdleHook( self, hook ):
+        '''
+        Set a function to be called whenever waitEvent is about to wait, that is
+        between frames when there is nothing to draw.
+        '''
+        self.idleHook = hook
         
-    def getSelButton( self ):
-        return self.button_x.read()
+    def setActivityHook( self, hook ):
+        '''
+        Set a function to be called for every button event.  If it returns True the
+        event is dropped, see PowerManager.activity.
+        '''
+        self.activityHook = hook
+        
+    async def buttonTask( self ):
+        '''
+        Background task that posts the button events, see buttons.py.  Up and down
+        repeat while held, select posts EVENT_LONG_SELECT when held.
+        '''
+        await self.buttons.run( self.post )
         
     def LED(self,R,G,B):
         self.led.set_rgb( R, G, B )
@@ -382,6 +903,9 @@ class Display:
     
     def createPanel( self, title ):
         return Panel( self, title )
+    
+    def createGraph( self, x, y, width, height, window_ms ):
+        return Graph( self, x, y, width, height, window_ms )
 
 def dummy( item ):
     print( f"Called Dummy with {item}")
@@ -394,6 +918,11 @@ if __name__ == "__main__":
     display = Display()
     panel = display.createListBox( 'Test...' )
     panel.setList( items, tabs )
-    panel.draw()
+    
+    async def main():
+        asyncio.create_task( display.buttonTask() )
+        await panel.draw()
+        
+    asyncio.run( main() )
 
     
\ No newline at end of file
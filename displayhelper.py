@@ -12,6 +12,33 @@ COLOR_PANEL  = const(5)
 COLOR_YELLOW = const(6)
 COLOR_ORANGE = const(7)
 
+#
+# Events handed out by Display.waitEvent
+#
+EVENT_UP     = const(1)         # Up button pressed
+EVENT_DOWN   = const(2)         # Down button pressed
+EVENT_SELECT = const(3)         # Select button pressed
+EVENT_CANCEL = const(4)         # Cancel button pressed
+EVENT_DATA   = const(5)         # Something the screen is showing has changed
+EVENT_LONG_SELECT = const(6)    # Select button held down
+
+def rssiColor( rssi ):
+    '''
+    Convert an RSSI to a color, based on the standard of what is a good power
+    level and what is not.
+    
+    Returns:
+        A color that represents how good the signal is.
+    '''
+    if rssi > -67:
+        return COLOR_GREEN      # Excellent
+    elif rssi > -70:
+        return COLOR_YELLOW     # Good
+    elif rssi > -80:
+        return COLOR_ORANGE     # Limited
+    else:
+        return COLOR_RED        # Poor, or not worth it
+
 class BaseItem:
     '''
     BaseItem class - This class should be used for any and all items that are to
@@ -73,10 +100,98 @@ class BaseItem:
         '''
         return self.text
     
+class ListModel:
+    '''
+    ListModel class - What a listbox shows.  The listbox only ever asks for the
+    rows it is showing, by index, so a model can present a list of any size
+    without anything being done for the rows off screen.  This class presents
+    a plain list of BaseItems; the device lists (BLEList, WLANList) are models
+    in their own right.
+    
+    A row's version lets the listbox skip formatting a row that has not changed
+    since it was drawn; None means the version is not known, and the row is
+    formatted every time.
+    
+    A row's key identifies the item in it however the list changes, the listbox
+    keeps the selection on the same item by finding its key again after every
+    update.
+    '''
+    def __init__( self, items=None ):
+        if items is None:
+            items = []
+        self.items = items
+        
+    def rowCount( self ):
+        '''
+        Returns:
+            The number of rows.
+        '''
+        return len(self.items)
+    
+    def rowItem( self, index ):
+        '''
+        Returns:
+            The item shown in a row, which is what the listbox hands back when the
+            row is selected.
+        '''
+        return self.items[index]
+    
+    def rowText( self, index ):
+        '''
+        Returns:
+            The text of a row, with its segments separated by tabs.
+        '''
+        return str(self.items[index])
+    
+    def rowColor( self, index ):
+        '''
+        Returns:
+            The color of a row.
+        '''
+        return self.items[index].getColor()
+    
+    def rowVersion( self, index ):
+        '''
+        Returns:
+            A value that changes whenever the text or color of the item in a row
+            changes, or None.
+        '''
+        return None
+    
+    def rowKey( self, index ):
+        '''
+        Returns:
+            The key of the item in a row, which stays the same for as long as the
+            item is in the list.
+        '''
+        return self.items[index]
+    
+    def rowIndex( self, key, hint=-1 ):
+        '''
+        Find the row holding the item with the given key.
+        
+        Parameters:
+            key  - Key of the item, see rowKey
+            hint - Row the item was last seen in, checked first
+            
+        Returns:
+            The index of the row, or -1 if the item is no longer in the list.
+        '''
+        if 0 <= hint < len(self.items) and self.rowKey( hint ) == key:
+            return hint
+        for index in range( len(self.items) ):
+            if self.rowKey( index ) == key:
+                return index
+        return -1
+    
 if __name__ == "__main__":
     
     item = BaseItem( "Test", defaultColor=COLOR_GREY)
     assert( item.getColor() == COLOR_GREY )
     assert( item.getFunction() == None )
     assert( str(item) == "Test" )
+    model = ListModel( [item] )
+    assert( model.rowCount() == 1 and model.rowText( 0 ) == "Test" )
+    assert( model.rowItem( 0 ) is item and model.rowColor( 0 ) == COLOR_GREY )
+    assert( model.rowIndex( model.rowKey( 0 ) ) == 0 and model.rowIndex( None ) == -1 )
 
@@ -0,0 +1,93 @@
+#
+# MemoryManager - decides when the garbage collector runs.
+#
+# Rather than collecting wherever memory might be short, collections are run at idle
+# points, between frames while the screen waits for an event, once enough has been
+# allocated since the last one to be worth it.  gc.threshold is set as a backstop, so
+# that MicroPython still collects by itself if allocation runs far ahead of the idle
+# points.  Anything else that has to collect (the device lists, when memory is short) is
+# handed collect(), so every collection is timed and counted here.
+#
+import gc
+import time
+
+GC_THRESHOLD = 24 * 1024        # bytes allocated before MicroPython collects by itself
+IDLE_ALLOC   = 8 * 1024         # bytes allocated before an idle point collects
+IDLE_MIN_MS  = 500              # least time between two idle collections
+
+class MemoryManager:
+    '''
+    MemoryManager - Runs collections at idle points and keeps the figures on
+    them: how many, how long each took, and how many MicroPython ran by itself.
+    '''
+    def __init__( self, threshold=GC_THRESHOLD, idleAlloc=IDLE_ALLOC, minInterval_ms=IDLE_MIN_MS ):
+        '''
+        Parameters:
+            threshold      - Bytes allocated before MicroPython collects by itself
+            idleAlloc      - Bytes allocated since the last collection before an idle
+                             point collects
+            minInterval_ms - Least time between two idle collections
+        '''
+        gc.enable()
+        if hasattr( gc, "threshold" ):
+            gc.threshold( threshold )
+        self.idleAlloc   = idleAlloc
+        self.minInterval = minInterval_ms
+        self.collections = 0            # collections run here
+        self.automatic   = 0            # collections MicroPython ran by itself, at least
+        self.idles       = 0            # idle points seen
+        self.lastUs      = 0
+        self.maxUs       = 0
+        self.totalUs     = 0
+        self.lastCollect = time.ticks_ms()
+        self.allocAfter  = gc.mem_alloc()   # allocated after the last collection
+        self.allocSeen   = self.allocAfter  # allocated at the last idle point
+
+    def collect( self ):
+        '''
+        Collect now, and time it.
+        '''
+        start = time.ticks_us()
+        gc.collect()
+        elapsed = time.ticks_diff( time.ticks_us(), start )
+        self.collections += 1
+        self.lastUs   = elapsed
+        self.totalUs += elapsed
+        if elapsed > self.maxUs:
+            self.maxUs = elapsed
+        self.lastCollect = time.ticks_ms()
+        self.allocAfter  = gc.mem_alloc()
+        self.allocSeen   = self.allocAfter
+
+    def idle( self ):
+        '''
+        Called at an idle point, collect if enough has been allocated since the last
+        collection and the last one was not too recent.  Allocated memory only goes
+        down when the collector runs, so finding less allocated than at the last idle
+        point means MicroPython collected by itself in between.
+        '''
+        self.idles += 1
+        alloc = gc.mem_alloc()
+        if alloc < self.allocSeen:
+            self.automatic += 1
+            self.allocAfter = alloc
+        self.allocSeen = alloc
+        if alloc - self.allocAfter >= self.idleAlloc and \
+           time.ticks_diff( time.ticks_ms(), self.lastCollect ) >= self.minInterval:
+            self.collect()
+
+    def stats( self ):
+        '''
+        Returns:
+            The collection counters, the times in microseconds.
+        '''
+        average = 0
+        if self.collections:
+            average = self.totalUs // self.collections
+        return { "collections" : self.collections,
+                 "automatic"   : self.automatic,
+                 "idles"       : self.idles,
+                 "lastUs"      : self.lastUs,
+                 "maxUs"       : self.maxUs,
+                 "averageUs"   : average,
+                 "sinceMs"     : time.ticks_diff( time.ticks_ms(), self.lastCollect ) }
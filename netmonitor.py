@@ -1,12 +1,31 @@
 from batterystate import BatteryState
 from display import Display
 from wifitools import WLAN, WLANList, WIFIScanner
-from bletools import BLEScanner, BLEItem
-from displayhelper import BaseItem
+from bletools import BLEScanner, BLEItem, BLEFilter
+from scanlog import ScanLog
+from memorymanager import MemoryManager
+from powermanager import PowerManager
+from displayhelper import BaseItem, rssiColor, EVENT_SELECT, EVENT_CANCEL, EVENT_DATA
+import asyncio
 import time
 import gc
 import bluetooth
 
+STATUS_REFRESH_MS = 2000        # How often the status and single device screens redraw
+BLE_DRAIN_MS      = 50          # How often queued bluetooth scan results are processed
+BLE_DRAIN_MAX_MS  = 20          # Longest the queue is drained for before the other tasks get a turn
+BLE_MIN_UPDATE_MS = 250         # Advertisements from a device closer together than this are dropped
+WIFI_IDLE_MS      = 500         # How often the wifiTask looks for a wifi screen being shown
+WIFI_TARGET_MS    = 250         # Pause between the narrowed scans while one network is watched
+WIFI_MAX_AGE_MS   = 30000       # Networks not seen for this long are dropped from the list
+BLE_MAX_DEVICES   = 300         # Most bluetooth devices kept, the least recently seen go first
+WIFI_MAX_NETWORKS = 100         # Most networks kept
+MEM_FREE_FLOOR    = 16 * 1024   # Devices are evicted when adding one leaves less memory free
+GRAPH_WINDOW_MS   = 60000       # Time span shown across the RSSI graphs
+BLE_FILTERS       = None        # BLEFilters admitting only the devices of interest, None for all
+LOG_PATH          = "scan.log"  # Scan log on flash, see scanlog.py
+LOG_INTERVAL_MS   = 10000       # How often the devices seen are written to the scan log
+
 class LANItem( BaseItem ):
     '''
     A LAN/Wifi item that we have found, uses the BaseItem class, so that we have
@@ -36,16 +55,7 @@ class LANItem( BaseItem ):
         Returns:
             A color that represents how good the signal is.
         '''
-        if self.wlan.rssi > -67:
-            return Display.GREEN     # Excellent
-        elif self.wlan.rssi > -70:
-            return Display.YELLOW    # Good
-        elif self.wlan.rssi > -80:
-            return Display.ORANGE    # Limited
-        elif self.wlan.rssi > -90:
-            return Display.RED       # Poor
-        else:
-            return Display.RED       # Yeah, not worth it.
+        return rssiColor( self.wlan.smoothed )
         
     def getName( self ):
         '''
@@ -68,51 +78,12 @@ class LANItem( BaseItem ):
 def dummy( item ):
     print( f"Called {item}" )
     
-def scaleValue( value, start,stop):
-    '''
-    Given the value passed in, convert it so that it is between the start
-    and stop values passed as well.
-    
-    Parameters:
-        value - The value we wish to scale
-        start - The start of the range
-        stop  - The end of the range
-        
-    Returns:
-        The scaled value.
-    '''
-    result = abs(value) + start
-    if result > stop:
-        result = stop
-    return result
-
-def displayGraphLine( xstart, ystart, height):
-    '''
-    Display a bar graph line.  The assumption is that the color of the line
-    is already set.  In order to draw the line we create a rectangle 2 pixels
-    wide.
-    
-    Two more rectangles are drawn, one *above* the area we just drew clearing
-    out anything that may be left over, and then another one is drawn using the
-    full range in GREY to poing out where we are currently observing.
-    
-    Parameters:
-        xstart - x position of the start of the graph
-        ystart - y position of the start of the graph
-        height - how high does the rectangle go relative to the ystart position
-
-    '''
-    display.rectangle( xstart, ystart, 2, height-ystart )
-    display.set_pen( Display.BLACK )
-    display.rectangle( xstart, 102, 2, ystart-102)
-    display.set_pen( Display.GREY )
-    display.rectangle( xstart+2, 102, 2, height-102)
-    
-def watchSingleNetwork( item ):
+async def watchSingleNetwork( item ):
     '''
-    Monitor a single network.  Get the network by SSID and report on the
+    Monitor a single network.  Get the network by BSSID and report on the
     power/channel and Security.  Generate a graph of the relative signale
-    strength
+    strength.  The network is kept up to date by the wifiTask, we redraw each
+    time it finishes a scan.
     
     Parameters:
         item - the network wlan item we are monitoring
@@ -122,44 +93,35 @@ def watchSingleNetwork( item ):
         False - Terminate the montioring and bounce back to the root function
     '''
     panel = display.createPanel( f"Monitoring {item.getName()}" )
-    count = 0
-    graphHeight = display.height - 2 #panel.height
-    graphWidth  = panel.width
-    xpos = 2 #panel.startx
+    graph = display.createGraph( 2, 102, panel.width - 2, display.height - 104, GRAPH_WINDOW_MS )
     panel.displayPanel(False)
     display.set_pen( Display.PANEL )
-    display.line( 0, 100, graphWidth, 100 )
+    display.line( 0, 100, panel.width, 100 )
     tabs = [0,100]
+    event = EVENT_DATA
+    first = True
     while True:
-        if display.getCancelButton():
+        if event == EVENT_CANCEL:
             return False
-        if display.getSelButton():
+        if event == EVENT_SELECT:
             return True
-        if count % 20 == 0:
-            display.LED( 0, 0, 128 )
-            lan = wscanner.scanForSpecificWLAN( item.wlan.ssid, 1 )
-            if lan is None:
-                lan = item.wlan
-            else:
-                item.wlan = lan
-            display.LED( 0, 0, 0 )
+        if event == EVENT_DATA:
+            lan = item.wlan
             panel.textAtClear( 2 )
             panel.textAt( f"Channel:\t{lan.channel}", 1, Display.GREY, tabs=tabs )
-            panel.textAt( f"RSSI:\t{lan.rssi}", 2, item.getColor(),tabs=tabs)
+            panel.textAt( f"RSSI:\t{lan.rssi} ({lan.history.smoothed})  {lan.history.quality()}%", 2, item.getColor(),tabs=tabs)
             panel.textAt( f"Security:\t{lan.getSecurity()}", 3, Display.GREY,tabs=tabs)
-            value = scaleValue( lan.rssi, 100, graphHeight )
-            display.set_pen( item.getColor() )
-            displayGraphLine( xpos, value, graphHeight)
-            xpos += 2
-            if xpos > graphWidth:
-                xpos = panel.startx
-            count = 0
-            display.update()
-        count += 1
-        time.sleep( 0.1 )
+            panel.textAt( f"BSSID:\t{lan.bssid}", 4, Display.GREY,tabs=tabs)
+            graph.draw( lan.history, not first )
+            if first:
+                display.update()
+                first = False
+            else:
+                display.updateLines( 1, 4 )
+        event = await display.waitEvent()
     return True
 
-def systemStatus(item):
+async def systemStatus(item):
     '''
     Display the status of the system, i.e. current battery level, memory available etc.
     
@@ -168,17 +130,15 @@ def systemStatus(item):
                 not used.
     '''
     panel = display.createPanel( 'System Status' )
-    count = 0
     tabs = [0, 180]
     panel.displayPanel(False)
     
-    bs = BatteryState()
+    bs = battery
     
-    while not display.getCancelButton():
-        if count % 20 == 0:
+    event = None
+    while event != EVENT_CANCEL:
+        if event is None:
             panel.displayPanel(False)
-            count = 0
-            gc.collect()
             panel.textAt( f"Memory Used:\t{gc.mem_alloc()}", 1, Display.GREY, tabs=tabs )
             panel.textAt( f"Memory Free:\t{gc.mem_free()}", 2, Display.GREY, tabs=tabs )
             if bs.isCharging():
@@ -186,12 +146,25 @@ def systemStatus(item):
             else:
                 panel.textAt( f"Voltage:\t{bs.getVoltage():.2f}",     3, Display.GREY,tabs=tabs )
                 panel.textAt( f"Percentage:\t{bs.getPercentage():.2f}%", 4, Display.GREY,tabs=tabs )
+            stats = scanner.getStats()
+            panel.textAt( f"BLE Decoded:\t{stats['decoded']}/{stats['received']}", 5, Display.GREY, tabs=tabs )
+            panel.textAt( f"BLE Devices:\t{stats['items']}/{BLE_MAX_DEVICES}", 6, Display.GREY, tabs=tabs )
+            panel.textAt( f"BLE Evicted:\t{stats['evicted']} + {stats['evictedMemory']} mem", 7, Display.GREY, tabs=tabs )
+            stats = wlanList.stats()
+            panel.textAt( f"Networks:\t{stats['items']}/{WIFI_MAX_NETWORKS}", 8, Display.GREY, tabs=tabs )
+            panel.textAt( f"Net Evicted:\t{stats['evicted']} + {stats['evictedMemory']} mem", 9, Display.GREY, tabs=tabs )
+            stats = memory.stats()
+            panel.textAt( f"GC Runs:\t{stats['collections']} + {stats['automatic']}, {stats['maxUs']//1000} ms", 10, Display.GREY, tabs=tabs )
+            budget = power.budget()
+            hours  = "/".join( [str(mode[2]) for mode in budget] )
+            amps   = "/".join( [str(mode[1]) for mode in budget] )
+            panel.textAt( f"Power {power.stats()['profile']}:\t{hours} h", 11, Display.GREY, tabs=tabs )
+            panel.textAt( f"Idle/BLE/WiFi:\t{amps} mA", 12, Display.GREY, tabs=tabs )
             display.update()
-        count += 1
-        time.sleep( 0.1 )
+        event = await display.waitEvent( STATUS_REFRESH_MS )
     return False
 
-def watchSingleBLE( item ):
+async def watchSingleBLE( item ):
     '''
     Monitor a single Bluetooth entry.  The Select button will switch between
     information collected mode, an a bar graph of the current RSSI of the device,
@@ -208,54 +181,50 @@ def watchSingleBLE( item ):
     '''
     panel = display.createPanel( f"Monitoring {item.getName()}" )
     panel.displayPanel(False)
-    graphHeight = display.height - 2 #panel.height
-    graphWidth  = panel.width
-    count = 0
+    graph = display.createGraph( 2, 102, panel.width - 2, display.height - 104, GRAPH_WINDOW_MS )
     displayMsgs = True
-    xpos = 2
+    event = None
+    first = True
     while True:
-        if display.getCancelButton():
+        if event == EVENT_CANCEL:
             return True
-        if display.getSelButton():
+        if event == EVENT_SELECT:
             panel.clearPanel()
-            count = 0
             if displayMsgs:
-                xpos = 2
                 display.set_pen( Display.PANEL )
-                display.line( 0, 100, graphWidth, 100 )
+                display.line( 0, 100, panel.width, 100 )
                 displayMsgs = False
             else:
                 displayMsgs = True
         #
-        if count % 20 == 0:
+        if event is None and not displayMsgs and not first:
+            panel.textAtClear( 2 )
+            panel.textAt( f"RSSI: {item.rssi} ({item.history.smoothed})  {item.history.quality()}%",2, item.getColor() )
+            display.updateLines( 2 )
+            graph.draw( item.history )
+        elif event is None or event == EVENT_SELECT:
+            first = False
             panel.textAt( f"Address Type: {item.getAddrType()}", 1, Display.GREY )
             panel.textAtClear( 2 )
-            panel.textAt( f"RSSI: {item.rssi}",2, item.getColor() )
+            panel.textAt( f"RSSI: {item.rssi} ({item.history.smoothed})  {item.history.quality()}%",2, item.getColor() )
             if displayMsgs:
                 line = 3
                 for data in item.data:
                     panel.textAt( f"{data[0]}: {data[1]}",line,Display.GREY,wrap=False)
                     line += 1
             else:
-                value = scaleValue( item.rssi, 100, graphHeight )
-                display.set_pen( item.getColor() )
-                displayGraphLine( xpos, value, graphHeight)
-                xpos += 2
-                if xpos > graphWidth:
-                    xpos = 2
+                graph.draw( item.history, False )
             display.update()
-        count += 1
-        time.sleep( 0.1 )
+        event = await display.waitEvent( STATUS_REFRESH_MS )
         
 def bluetoothAsyncFunction():
-    gc.collect()
     return scanner.get_scan_results()
 
-def bluetoothDisplay( item ):
+async def bluetoothDisplay( item ):
     '''
     Display all of the bluetooth items we find.  The call to scanner.get_scan_results
     simply returns any and all items we have located, the scanning is occuring in
-    the background.
+    the background and the results are processed by the bleTask.
     
     Parameters:
         item - The item from the main menu
@@ -263,29 +232,35 @@ def bluetoothDisplay( item ):
     '''
     listBox = display.createListBox( 'Blue Tooth' )
     running = True
-    scanner.start_scan(0,active=True)
+    scanner.start_scan(0,power.bleInterval,power.bleWindow,active=True)
     items = []
     tabs = [0,190, 210, 270,0]
     while running:
         items = scanner.get_scan_results()
         if len(items):
             listBox.setList( items, tabs )
-            item = listBox.draw(asyncFunc=bluetoothAsyncFunction)
+            item = await listBox.draw(asyncFunc=bluetoothAsyncFunction)
             if item is None:
                 running = False
             else:
                 function = item.getFunction()
-                running  = function(item)
-        else:
-            time.sleep( 0.1 )
+                items.pin( item )
+                running  = await function(item)
+                items.unpin()
+        elif await display.waitEvent( BLE_DRAIN_MS ) == EVENT_CANCEL:
+            running = False
     
     scanner.stop_scan()
     return False
 
-def networkDisplay(item):
+def networkAsyncFunction():
+    return wlanList
+
+async def networkDisplay(item):
     '''
     Display the currently available wireless networks available, and display
-    information about them.
+    information about them.  While this screen is shown the wifiTask keeps
+    scanning in the background.
     
     Parameters:
         A context item from where every we were called from.  In this
@@ -294,31 +269,142 @@ def networkDisplay(item):
         
     Returns: False
     '''
+    global wifiActive
     panel = display.createListBox( "Networking" )
     panel.displayPanel()
-    wlanList = WLANList()
     running = True
+    wifiActive = True
     tabs = [0,240,275,0]
     while running:
-        panel.changeTitle( "Scanning...", True )
-        display.LED( 0, 0, 128 )
-        wscanner.scanForWLANS( wlanList, 1 )
-        wlanList.sortItems()
-        items = []
-        for lan in wlanList:
-            items.append( LANItem( lan, watchSingleNetwork ) )
-        display.LED( 0, 0, 0 )
+        if len(wlanList) == 0:
+            panel.changeTitle( "Scanning...", True )
+            if await display.waitEvent() == EVENT_CANCEL:
+                running = False
+            continue
         panel.changeTitle( "Networking" )
-        panel.setList( items, tabs )
-        item = panel.draw()
-        if not item is None:
+        panel.setList( wlanList, tabs )
+        lan = await panel.draw( asyncFunc=networkAsyncFunction )
+        if lan is None:
+            running = False
+        else:
+            item = LANItem( lan, watchSingleNetwork )
             function = item.getFunction()
-            running = function( item )
+            wlanList.pin( lan )
+            wscanner.setTarget( lan )
+            running = await function( item )
+            wscanner.clearTarget()
+            wlanList.resetAges()
+            wlanList.unpin()
+    wifiActive = False
+    wscanner.cancel()
     return False
+
+async def bleTask():
+    '''
+    Background task, process the bluetooth scan results queued up by the IRQ.  The
+    queue is drained a batch at a time, yielding between batches, until it is empty
+    or BLE_DRAIN_MAX_MS has gone by.
+    '''
+    while True:
+        start = time.ticks_ms()
+        while scanner.process() and time.ticks_diff( time.ticks_ms(), start ) < BLE_DRAIN_MAX_MS:
+            await asyncio.sleep( 0 )
+        await asyncio.sleep( BLE_DRAIN_MS / 1000 )
+        
+async def wifiTask():
+    '''
+    Background task, scan for wifi networks while a wifi screen is being shown.
+    The results are merged into wlanList, networks that have gone away are aged
+    out, and the screen is told a scan has finished.  wlanList is the listbox's
+    model, so the listbox only repaints the networks that changed.
+    
+    The scan runs in the background, so the screens keep responding to the
+    buttons while it is under way; leaving the wifi screens cancels it.  While
+    a single network is watched the scans are narrowed down to it, and run more
+    often.  Networks are only aged out after a full scan, as the narrowed ones do
+    not look for them; a narrowed scan finishing after the watch has ended does
+    not count.
+    Otherwise the pause between scans comes from the power profile.
+    '''
+    while True:
+        pause = WIFI_IDLE_MS
+        if wifiActive:
+            pause = power.wifiScanMs
+            display.LED( 0, 0, 128 )
+            results = await wscanner.scan()
+            display.LED( 0, 0, 0 )
+            if results is not None:
+                wscanner.mergeResults( wlanList, results )
+                if wscanner.resultTarget is None:
+                    wlanList.ageOut( WIFI_MAX_AGE_MS )
+                if wscanner.target is not None:
+                    pause = WIFI_TARGET_MS
+                wlanList.sortItems()
+                display.post( EVENT_DATA )
+        await asyncio.sleep( pause / 1000 )
+
+async def logTask():
+    '''
+    Background task, every LOG_INTERVAL_MS record each network and bluetooth
+    device seen since the last pass in the scan log.  The log only writes to
+    flash once it has a block of records, or one has waited too long.
+    '''
+    last = time.ticks_ms()
+    while True:
+        await asyncio.sleep( LOG_INTERVAL_MS / 1000 )
+        now = time.ticks_ms()
+        for lan in wlanList:
+            if time.ticks_diff( lan.lastSeen, last ) > 0:
+                scanLog.logWLAN( lan )
+        results = scanner.get_scan_results()
+        if results is not None:
+            for item in results:
+                if time.ticks_diff( item.lastSeen, last ) > 0:
+                    scanLog.logBLE( item )
+        scanLog.flushStale()
+        last = now
+        
+def powerChanged():
+    '''
+    The power profile changed, a bluetooth scan that is running picks up the new
+    duty cycle, the wifiTask picks up its pause on the next scan.
+    '''
+    scanner.setDutyCycle( power.bleInterval, power.bleWindow )
+    
+def canSleep():
+    '''
+    The CPU may only lightsleep while neither radio is scanning, a wifi scan
+    that was cancelled keeps the radio busy until it finishes.
+    '''
+    return not wifiActive and not wscanner.busy and not scanner.scanning
+    
+async def main():
+    '''
+    Start the background tasks, and run the main menu.
+    '''
+    asyncio.create_task( display.buttonTask() )
+    asyncio.create_task( bleTask() )
+    asyncio.create_task( wifiTask() )
+    asyncio.create_task( logTask() )
+    asyncio.create_task( power.run( powerChanged, canSleep ) )
+    while True:
+        item = await mainPanel.draw()
+        if not item is None:
+            function  = item.getFunction()
+            await function( item )
     
-scanner = BLEScanner(bluetooth.BLE(),watchSingleBLE)
+memory  = MemoryManager()
+scanner = BLEScanner(bluetooth.BLE(),watchSingleBLE,minInterval=BLE_MIN_UPDATE_MS,
+                     maxItems=BLE_MAX_DEVICES,memFloor=MEM_FREE_FLOOR,collect=memory.collect)
+scanner.setFilters( BLE_FILTERS )
 wscanner  =  WIFIScanner()
+wlanList  = WLANList( WIFI_MAX_NETWORKS, MEM_FREE_FLOOR, memory.collect )
+scanLog   = ScanLog( LOG_PATH )
+wifiActive = False
 display = Display()
+battery = BatteryState()
+power   = PowerManager( display, battery )
+display.setActivityHook( power.activity )
 
 mainItems = []
 mainItems.append( BaseItem( f"Status",    systemStatus ) )
@@ -328,10 +414,6 @@ mainItems.append( BaseItem( f"Networks",  networkDisplay ) )
 mainPanel = display.createListBox( "NetMonitor v1.0" )
 mainPanel.setList( mainItems )
 
-gc.enable()
+display.setIdleHook( memory.idle )
 
-while True:
-    item = mainPanel.draw()
-    if not item is None:
-        function  = item.getFunction()
-        function( item )
\ No newline at end of file
+asyncio.run( main() )
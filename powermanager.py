@@ -0,0 +1,265 @@
+#
+# PowerManager - stretches the LiPo SHIM battery.
+#
+# The backlight is dimmed after a while without a button press and turned off after a
+# while longer; while it is off nothing is pushed to the panel, and the first press only
+# turns it back on.  The screens redraw less often as the backlight dims, and, through the
+# power profile, as the battery runs down.
+#
+# The power profile is picked from the battery percentage, and sets the bluetooth scan
+# duty cycle, the pause between wifi scans and how much the screen refreshes are
+# stretched.  Running from USB (charging) always uses the first profile.
+#
+# When the backlight is off, no radio is in use and the Pico is not on USB, the CPU is put
+# in lightsleep between events, a slice at a time; a button press wakes it.
+#
+# The power budget is a rough estimate of the current drawn, built from the figures below
+# for what is turned on and how much of the time.
+#
+import time
+import asyncio
+import machine
+
+#            name    battery%  BLE interval  BLE window   wifi pause  refresh
+PROFILES = ( ("Full",   50,    1000000,      1000000,     2000,       1),
+             ("Save",   20,    1000000,       500000,     5000,       2),
+             ("Low",     0,    1000000,       200000,    15000,       4) )
+
+_NAME     = 0
+_PERCENT  = 1
+_INTERVAL = 2
+_WINDOW   = 3
+_WIFI     = 4
+_REFRESH  = 5
+
+PROFILE_HYSTERESIS = 5          # percent the battery has to rise by before a better profile is used
+
+BACKLIGHT_ON     = 0.8          # backlight while in use
+BACKLIGHT_DIM    = 0.2          # backlight once dimmed
+DIM_MS           = 30000        # time without a button press before the backlight dims
+BLANK_MS         = 120000       # ... and before it is turned off
+DIM_REFRESH      = 2            # refreshes are stretched this much more while dimmed
+BLANK_REFRESH    = 8            # ... and while the backlight is off
+CHECK_MS         = 1000         # how often the power task runs
+BATTERY_CHECK_MS = 30000        # how often the battery is read
+SLEEP_SLICE_MS   = 1000         # longest single lightsleep
+
+#
+# Power budget figures, in mA
+#
+CPU_MA            = 25          # RP2040 running
+SLEEP_MA          = 2           # RP2040 in lightsleep
+BACKLIGHT_MA      = 60          # backlight at full
+BLE_RX_MA         = 30          # radio receiving, for the scan window
+WIFI_SCAN_MA      = 60          # radio during a wifi scan
+WIFI_SCAN_TIME_MS = 2500        # how long a wifi scan keeps the radio on
+BATTERY_MAH       = 1000        # capacity of the LiPo
+
+#         mode    bluetooth  wifi
+MODES = ( ("Idle", False,    False),
+          ("BLE",  True,     False),
+          ("WiFi", False,    True) )
+
+class PowerManager:
+    '''
+    PowerManager - Owns the backlight and the power profile, and puts the CPU to
+    sleep when nothing needs it.
+    '''
+    def __init__( self, display, battery, dim_ms=DIM_MS, blank_ms=BLANK_MS, capacity_mAh=BATTERY_MAH ):
+        '''
+        Parameters:
+            display      - The Display, whose backlight and refresh rate are managed
+            battery      - The BatteryState the profile is picked from
+            dim_ms       - Time without a button press before the backlight dims
+            blank_ms     - Time without a button press before the backlight goes off
+            capacity_mAh - Capacity of the battery, for the budget
+        '''
+        self.display   = display
+        self.battery   = battery
+        self.dimMs     = dim_ms
+        self.blankMs   = blank_ms
+        self.capacity  = capacity_mAh
+        self.profile   = PROFILES[0]
+        self.percent   = 100
+        self.charging  = True
+        self.dimmed    = False
+        self.blanked   = False
+        self.lastActive  = time.ticks_ms()
+        self.lastBattery = None
+        self.changes   = 0          # profile changes
+        self.sleeps    = 0          # lightsleeps taken
+        self.sleptMs   = 0          # time spent in lightsleep
+        self.wakes     = 0          # presses that only turned the backlight back on
+        display.set_backlight( BACKLIGHT_ON )
+        self._refresh()
+
+    @property
+    def bleInterval( self ):
+        return self.profile[_INTERVAL]
+
+    @property
+    def bleWindow( self ):
+        return self.profile[_WINDOW]
+
+    @property
+    def wifiScanMs( self ):
+        return self.profile[_WIFI]
+
+    def _refresh( self ):
+        '''
+        Set how much the display stretches its refreshes.
+        '''
+        scale = self.profile[_REFRESH]
+        if self.blanked:
+            scale *= BLANK_REFRESH
+        elif self.dimmed:
+            scale *= DIM_REFRESH
+        self.display.refreshScale = scale
+
+    def activity( self ):
+        '''
+        Called for every button event, turns the backlight back up.
+
+        Returns:
+            True if the backlight was off, the event only woke the screen and should
+            be dropped.
+        '''
+        self.lastActive = time.ticks_ms()
+        if not self.dimmed:
+            return False
+        woken = self.blanked
+        self.dimmed  = False
+        self.blanked = False
+        self.display.set_backlight( BACKLIGHT_ON )
+        if woken:
+            self.display.unblank()
+            self.wakes += 1
+        self._refresh()
+        return woken
+
+    def _pickProfile( self ):
+        '''
+        Returns:
+            The profile for the battery percentage last read.  A better profile than
+            the current one is only picked once the battery is PROFILE_HYSTERESIS
+            above its threshold, so the profile does not flap.
+        '''
+        if self.charging:
+            return PROFILES[0]
+        current = PROFILES.index( self.profile )
+        for index in range( len(PROFILES) ):
+            threshold = PROFILES[index][_PERCENT]
+            if index < current:
+                threshold += PROFILE_HYSTERESIS
+            if self.percent >= threshold:
+                return PROFILES[index]
+        return PROFILES[-1]
+
+    def check( self, now ):
+        '''
+        Dim or turn off the backlight if it has been long enough since the last
+        button press, and every BATTERY_CHECK_MS read the battery and pick the
+        profile.
+
+        Returns:
+            True if the profile changed.
+        '''
+        idle = time.ticks_diff( now, self.lastActive )
+        if not self.dimmed and idle >= self.dimMs:
+            self.dimmed = True
+            self.display.set_backlight( BACKLIGHT_DIM )
+            self._refresh()
+        if not self.blanked and idle >= self.blankMs:
+            self.blanked = True
+            self.display.set_backlight( 0 )
+            self.display.blank()
+            self._refresh()
+        if self.lastBattery is not None and time.ticks_diff( now, self.lastBattery ) < BATTERY_CHECK_MS:
+            return False
+        self.lastBattery = now
+        self.charging = self.battery.isCharging()
+        self.percent  = int( self.battery.getPercentage() )
+        profile = self._pickProfile()
+        if profile is self.profile:
+            return False
+        self.profile = profile
+        self.changes += 1
+        self._refresh()
+        return True
+
+    def sleep( self, ms ):
+        '''
+        Lightsleep for up to ms, a button press wakes the CPU sooner.
+        '''
+        start = time.ticks_ms()
+        machine.lightsleep( ms )
+        self.sleeps  += 1
+        self.sleptMs += time.ticks_diff( time.ticks_ms(), start )
+
+    async def run( self, changed=None, canSleep=None ):
+        '''
+        The power task.
+
+        Parameters:
+            changed  - Called when the profile changes
+            canSleep - Called to ask whether the CPU may lightsleep, it must not while
+                       a radio is in use
+        '''
+        while True:
+            if self.check( time.ticks_ms() ) and changed is not None:
+                changed()
+            if self.blanked and not self.charging and canSleep is not None and canSleep():
+                self.sleep( SLEEP_SLICE_MS )
+                await asyncio.sleep( 0 )
+            else:
+                await asyncio.sleep( CHECK_MS / 1000 )
+
+    def estimate( self, profile, ble, wifi ):
+        '''
+        Estimate the current drawn in a profile.
+
+        Parameters:
+            profile - One of PROFILES
+            ble     - A bluetooth scan is running
+            wifi    - Wifi scans are running
+
+        Returns:
+            The current in mA.
+        '''
+        if self.blanked and not ble and not wifi:
+            current = SLEEP_MA
+        else:
+            current = CPU_MA
+        if not self.blanked:
+            current += BACKLIGHT_MA * (BACKLIGHT_DIM if self.dimmed else BACKLIGHT_ON)
+        if ble:
+            current += BLE_RX_MA * profile[_WINDOW] / profile[_INTERVAL]
+        if wifi:
+            current += WIFI_SCAN_MA * WIFI_SCAN_TIME_MS / (WIFI_SCAN_TIME_MS + profile[_WIFI])
+        return int( current + 0.5 )
+
+    def budget( self ):
+        '''
+        The power budget of each mode, idle, scanning for bluetooth devices and
+        scanning for wifi networks, in the current profile with the backlight as
+        it is.
+
+        Returns:
+            A list of (mode, mA, hours the battery lasts) tuples, one per mode.
+        '''
+        budget = []
+        for mode, ble, wifi in MODES:
+            current = self.estimate( self.profile, ble, wifi )
+            budget.append( (mode, current, self.capacity // current) )
+        return budget
+
+    def stats( self ):
+        return { "profile"  : self.profile[_NAME],
+                 "percent"  : self.percent,
+                 "charging" : self.charging,
+                 "dimmed"   : self.dimmed,
+                 "blanked"  : self.blanked,
+                 "changes"  : self.changes,
+                 "sleeps"   : self.sleeps,
+                 "sleptMs"  : self.sleptMs,
+                 "wakes"    : self.wakes }
@@ -0,0 +1,251 @@
+#
+# RecordPool - compact storage for the devices we have seen.
+#
+# Every device is a fixed size record packed into a preallocated bytearray, rather
+# than a handful of separate strings, lists and ints hanging off an object.  The
+# objects that represent a device (WLAN, BLEItem) only hold on to the buffer and
+# offset of their record, and present the fields through properties.
+#
+# The lists holding the devices (WLANList, BLEList) share their eviction policy through
+# BoundedList.
+#
+import gc
+import time
+
+EVICT_FRACTION = 8              # a full list drops 1/8 of its devices at a time
+
+class RecordPool:
+    '''
+    RecordPool - A pool of fixed size records.  Records are allocated in chunks of
+    chunkRecords, so growing the pool never moves (or copies) an existing record
+    and a record's buffer and offset stay valid until it is released.
+    '''
+    def __init__( self, recordSize, chunkRecords=32 ):
+        '''
+        Parameters:
+            recordSize   - Size of one record in bytes
+            chunkRecords - Number of records allocated together when the pool grows
+        '''
+        self.recordSize   = recordSize
+        self.chunkRecords = chunkRecords
+        self.chunks       = []
+        self.free         = []          # slots released and ready for reuse
+        self.used         = 0
+        self.next         = 0           # first slot never handed out
+
+    def __len__( self ):
+        '''
+        Number of records currently allocated.
+        '''
+        return self.used
+
+    def capacity( self ):
+        '''
+        Number of records the pool can hold without growing.
+        '''
+        return len(self.chunks) * self.chunkRecords
+
+    def alloc( self ):
+        '''
+        Allocate a record, the record is cleared to zero.
+
+        Returns:
+            The slot number of the record.
+        '''
+        if len(self.free):
+            slot = self.free.pop()
+        else:
+            if self.next == self.capacity():
+                self.chunks.append( bytearray( self.recordSize * self.chunkRecords ) )
+            slot = self.next
+            self.next += 1
+        self.used += 1
+        buffer, offset = self.locate( slot )
+        for i in range( offset, offset + self.recordSize ):
+            buffer[i] = 0
+        return slot
+
+    def release( self, slot ):
+        '''
+        Give a record back to the pool.  Anything still holding the buffer and offset
+        of the record will see it reused.
+        '''
+        self.free.append( slot )
+        self.used -= 1
+
+    def locate( self, slot ):
+        '''
+        Returns:
+            The buffer holding a record, and the offset of the record within it.
+        '''
+        return self.chunks[slot // self.chunkRecords], (slot % self.chunkRecords) * self.recordSize
+
+    def detach( self, slot ):
+        '''
+        Copy a record out of the pool and release it.  Used when a device is dropped
+        from a list while something (the screen watching it for instance) may still
+        hold on to it; the copy keeps its last values.
+
+        Returns:
+            The buffer and offset of the copy.
+        '''
+        buffer, offset = self.locate( slot )
+        copy = bytearray( buffer[offset:offset+self.recordSize] )
+        self.release( slot )
+        return copy, 0
+
+    def memory( self ):
+        '''
+        Bytes of record storage allocated by the pool.
+        '''
+        return len(self.chunks) * self.chunkRecords * self.recordSize
+
+class PooledRecord:
+    '''
+    PooledRecord - Base of the objects that represent a device by a record.  The
+    record starts out in a small buffer of its own, attach() moves it into a pool
+    and detach() back out again.  Subclasses set RECORD_SIZE.
+    '''
+    RECORD_SIZE = 0
+
+    def newRecord( self ):
+        '''
+        Give the object a record of its own, cleared to zero.
+        '''
+        self._buf  = bytearray( self.RECORD_SIZE )
+        self._off  = 0
+        self._slot = -1
+
+    def attach( self, pool ):
+        '''
+        Move the record into a pool, done by the list when the device is added.
+        '''
+        slot = pool.alloc()
+        buffer, offset = pool.locate( slot )
+        buffer[offset:offset+self.RECORD_SIZE] = self._buf[self._off:self._off+self.RECORD_SIZE]
+        self._buf, self._off, self._slot = buffer, offset, slot
+
+    def detach( self, pool ):
+        '''
+        Move the record back out of the pool, done by the list when the device is removed.
+        '''
+        self._buf, self._off = pool.detach( self._slot )
+        self._slot = -1
+
+class BoundedList:
+    '''
+    BoundedList - The eviction policy of a list of devices.  A list can be bounded
+    by a number of devices, or by a floor on gc.mem_free().  When adding a device
+    would break either, 1/EVICT_FRACTION of the devices are evicted, those seen
+    least recently first, apart from the pinned one (the device being watched).
+    Memory is only collected when mem_free() is under the floor, to tell real
+    shortage from garbage not yet collected, and through the collect function the
+    list was given (MemoryManager.collect), so the collection is timed and counted
+    with the rest.
+
+    Subclasses call bound() from __init__, and provide members() (the list of
+    devices), _remove() (drop a device from the indexes and release its record)
+    and _setMembers() (replace the list of devices).
+    '''
+    def bound( self, maxItems, memFloor, collect=None ):
+        '''
+        Parameters:
+            maxItems - Most devices kept, 0 for no limit
+            memFloor - Evict devices when adding one finds less free memory than
+                       this, 0 for never
+            collect  - Function that runs a collection, gc.collect if None
+        '''
+        self.maxItems      = maxItems
+        self.memFloor      = memFloor
+        self.collect       = gc.collect if collect is None else collect
+        self.pinned        = None   # never evicted
+        self.evicted       = 0      # devices evicted because the list was full
+        self.evictedMemory = 0      # ... because memory was short
+
+    def pin( self, item ):
+        '''
+        Keep a device in the list, whatever the eviction policy, until unpin().
+        '''
+        self.pinned = item
+
+    def unpin( self ):
+        self.pinned = None
+
+    def evict( self, count ):
+        '''
+        evict - Remove the count devices seen least recently, never the pinned one.
+
+        Returns:
+            The number of devices removed.
+        '''
+        now     = time.ticks_ms()
+        members = self.members()
+        candidates = [ item for item in members if item is not self.pinned ]
+        candidates.sort( key=lambda item: time.ticks_diff( now, item.lastSeen ), reverse=True )
+        doomed = {}
+        for item in candidates[:count]:
+            doomed[item] = True
+            self._remove( item )
+        if len(doomed):
+            self._setMembers( [ item for item in members if item not in doomed ] )
+        return len(doomed)
+
+    def _makeRoom( self ):
+        '''
+        Called before a new device is added, evict some if the list is full or
+        memory is short.
+        '''
+        if self.maxItems and len(self.members()) >= self.maxItems:
+            self.evicted += self.evict( max( 1, self.maxItems // EVICT_FRACTION ) )
+        elif self.memFloor and gc.mem_free() < self.memFloor:
+            self.collect()
+            if gc.mem_free() < self.memFloor:
+                self.evictedMemory += self.evict( max( 1, len(self.members()) // EVICT_FRACTION ) )
+
+#
+# Accessors for fields wider than a byte, all little endian.
+#
+def getInt8( buffer, offset ):
+    value = buffer[offset]
+    if value > 127:
+        value -= 256
+    return value
+
+def setInt8( buffer, offset, value ):
+    buffer[offset] = value & 0xFF
+
+def getInt16( buffer, offset ):
+    value = buffer[offset] | (buffer[offset+1] << 8)
+    if value > 32767:
+        value -= 65536
+    return value
+
+def getUInt16( buffer, offset ):
+    return buffer[offset] | (buffer[offset+1] << 8)
+
+def setUInt16( buffer, offset, value ):
+    buffer[offset]   = value & 0xFF
+    buffer[offset+1] = (value >> 8) & 0xFF
+
+def getUInt32( buffer, offset ):
+    return buffer[offset] | (buffer[offset+1] << 8) | (buffer[offset+2] << 16) | (buffer[offset+3] << 24)
+
+def setUInt32( buffer, offset, value ):
+    buffer[offset]   = value & 0xFF
+    buffer[offset+1] = (value >> 8) & 0xFF
+    buffer[offset+2] = (value >> 16) & 0xFF
+    buffer[offset+3] = (value >> 24) & 0xFF
+
+def setBytes( buffer, offset, data, maxLength ):
+    '''
+    Copy up to maxLength bytes of data into a record.
+
+    Returns:
+        The number of bytes copied.
+    '''
+    length = len(data)
+    if length > maxLength:
+        length = maxLength
+        data   = data[:maxLength]
+    buffer[offset:offset+length] = data
+    return length
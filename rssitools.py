@@ -0,0 +1,234 @@
+#
+# RSSI tools - the signal strength history and smoothing kept for every device we have seen.
+#
+# Every device record carries a block of RSSI_SIZE bytes, filled as scans and
+# advertisements come in whether or not the device is being watched:
+#
+#   0   i16         smoothed RSSI, in 1/16 dB
+#   2   u8          slot the next sample goes in
+#   3   u8          number of samples in the ring
+#   4   u16         time of the newest sample, in HISTORY_TICK_MS
+#   6   i16         sum of the last STATS_WINDOW samples
+#   8   u32         sum of their squares
+#   12  i8 x 32     ring of RSSI samples
+#   44  u8 x 32     time from the sample before to each sample, in HISTORY_TICK_MS
+#
+# The smoothed RSSI and the sums are kept up to date as each sample arrives, so every
+# device has its average and variance (and so its quality) to hand, without going back
+# over the samples.
+#
+# Storing the gap between samples rather than the time of each keeps a sample to two
+# bytes.  A gap is at most 255 ticks (about a minute), a longer one is cut short, which
+# only moves samples that are already off the left of the graph.  Sample times wrap after
+# about four and a half hours.
+#
+import time
+
+from micropython import const
+from recordpool import PooledRecord, getInt8, setInt8, getInt16, getUInt16, setUInt16, getUInt32, setUInt32
+
+HISTORY_TICK_MS     = 250       # resolution of the sample times
+HISTORY_INTERVAL_MS = 2000      # samples closer together than this share a slot
+SMOOTHING_SHIFT     = 2         # each sample moves the smoothed RSSI 1/4 of the way to it
+STATS_WINDOW        = 8         # samples the min/max/variance are taken over
+
+_RSSI_EWMA    = const(0)
+_RSSI_HEAD    = const(2)
+_RSSI_COUNT   = const(3)
+_RSSI_LAST    = const(4)
+_RSSI_SUM     = const(6)
+_RSSI_SUMSQ   = const(8)
+_RSSI_SAMPLES = const(12)
+_RSSI_GAPS    = const(44)
+_HISTORY_MAX  = const(32)       # samples kept, 32 slots of at least HISTORY_INTERVAL_MS cover a minute
+_GAP_MAX      = const(255)
+RSSI_SIZE     = const(76)
+
+def smooth( ewma, rssi ):
+    '''
+    Returns:
+        The smoothed RSSI, in 1/16 dB, moved on by a new sample.
+    '''
+    return ewma + (((rssi << 4) - ewma) >> SMOOTHING_SHIFT)
+
+def _now():
+    return (time.ticks_ms() // HISTORY_TICK_MS) & 0xFFFF
+
+def rssiAdd( buffer, offset, rssi, interval ):
+    '''
+    Record a new sample in the RSSI block at offset.  A sample arriving within
+    interval ticks of the newest one replaces it rather than taking a new slot, so
+    a device that advertises many times a second does not flush its history in a
+    few seconds.  The smoothed RSSI and the window sums move on with it.  Allocates
+    nothing.
+    '''
+    now   = _now()
+    count = buffer[offset+_RSSI_COUNT]
+    head  = buffer[offset+_RSSI_HEAD]
+    total = getInt16( buffer, offset+_RSSI_SUM )
+    sumSq = getUInt32( buffer, offset+_RSSI_SUMSQ )
+    if count == 0:
+        setUInt16( buffer, offset+_RSSI_EWMA, rssi << 4 )
+        gap = 0
+    else:
+        setUInt16( buffer, offset+_RSSI_EWMA, smooth( getInt16( buffer, offset+_RSSI_EWMA ), rssi ) )
+        gap = (now - getUInt16( buffer, offset+_RSSI_LAST )) & 0xFFFF
+        if gap < interval:
+            last = head - 1 if head else _HISTORY_MAX - 1
+            old  = getInt8( buffer, offset+_RSSI_SAMPLES+last )
+            setInt8( buffer, offset+_RSSI_SAMPLES+last, rssi )
+            setUInt16( buffer, offset+_RSSI_SUM, total + rssi - old )
+            setUInt32( buffer, offset+_RSSI_SUMSQ, sumSq + rssi * rssi - old * old )
+            return
+        if gap > _GAP_MAX:
+            gap = _GAP_MAX
+        if count >= STATS_WINDOW:
+            first = head - STATS_WINDOW
+            if first < 0:
+                first += _HISTORY_MAX
+            old    = getInt8( buffer, offset+_RSSI_SAMPLES+first )
+            total -= old
+            sumSq -= old * old
+    setUInt16( buffer, offset+_RSSI_SUM, total + rssi )
+    setUInt32( buffer, offset+_RSSI_SUMSQ, sumSq + rssi * rssi )
+    setInt8( buffer, offset+_RSSI_SAMPLES+head, rssi )
+    buffer[offset+_RSSI_GAPS+head] = gap
+    setUInt16( buffer, offset+_RSSI_LAST, now )
+    head += 1
+    buffer[offset+_RSSI_HEAD] = 0 if head == _HISTORY_MAX else head
+    if count < _HISTORY_MAX:
+        buffer[offset+_RSSI_COUNT] = count + 1
+
+class RSSIHistory:
+    '''
+    RSSIHistory - A view onto the RSSI block of a record, as the graph and the
+    watch screens read it.  A view is cheap, and is taken afresh for each use as
+    the record moves when its device is added to or dropped from a list.
+
+    Ages are measured from when the view was taken, and are quickest to find
+    going from the newest sample back.
+    '''
+    def __init__( self, buffer, offset ):
+        '''
+        Parameters:
+            buffer - Buffer holding the record
+            offset - Offset of the RSSI block within it
+        '''
+        self.buffer = buffer
+        self.offset = offset
+        self.count  = buffer[offset+_RSSI_COUNT]
+        self.newest = (_now() - getUInt16( buffer, offset+_RSSI_LAST )) & 0xFFFF
+        self.index  = -1            # sample the age in ticks was last found for
+        self.ticks  = 0
+
+    def __len__( self ):
+        return self.count
+
+    def _slot( self, index ):
+        slot = self.buffer[self.offset+_RSSI_HEAD] - self.count + index
+        if slot < 0:
+            slot += _HISTORY_MAX
+        return slot
+
+    def sample( self, index ):
+        '''
+        Returns:
+            A sample, index 0 being the oldest kept and len()-1 the latest.
+        '''
+        return getInt8( self.buffer, self.offset+_RSSI_SAMPLES+self._slot( index ) )
+
+    def age( self, index ):
+        '''
+        Returns:
+            How long ago a sample was taken, in milliseconds.
+        '''
+        if self.index < index:
+            self.index = self.count - 1
+            self.ticks = self.newest
+        while self.index > index:
+            self.ticks += self.buffer[self.offset+_RSSI_GAPS+self._slot( self.index )]
+            self.index -= 1
+        return self.ticks * HISTORY_TICK_MS
+
+    def latest( self ):
+        '''
+        Returns:
+            The most recent sample, or None if there are none.
+        '''
+        if self.count == 0:
+            return None
+        return self.sample( self.count - 1 )
+
+    @property
+    def smoothed( self ):
+        '''
+        The exponentially smoothed RSSI, rounded to a whole dB.
+        '''
+        return (getInt16( self.buffer, self.offset+_RSSI_EWMA ) + 8) >> 4
+
+    def stats( self ):
+        '''
+        Returns:
+            The minimum, average, maximum and variance of the last STATS_WINDOW
+            samples, or None if there are none.
+        '''
+        count = min( self.count, STATS_WINDOW )
+        if count == 0:
+            return None
+        low  = 127
+        high = -128
+        for i in range( self.count - count, self.count ):
+            sample = self.sample( i )
+            if sample < low:
+                low = sample
+            if sample > high:
+                high = sample
+        total    = getInt16( self.buffer, self.offset+_RSSI_SUM )
+        sumSq    = getUInt32( self.buffer, self.offset+_RSSI_SUMSQ )
+        variance = (count * sumSq - total * total) // (count * count)
+        return low, total // count, high, variance
+
+    def quality( self ):
+        '''
+        Estimate the quality of the signal as a percentage: 100% at -50 dBm or
+        better falling to 0% at -100 dBm, judged on the smoothed RSSI, less 2% for
+        every dB of standard deviation over the window, as an unsteady signal is
+        less use than a steady one.
+        '''
+        if self.count == 0:
+            return 0
+        quality = (self.smoothed + 100) * 2
+        quality -= int( 2 * self.stats()[3] ** 0.5 )
+        if quality < 0:
+            return 0
+        if quality > 100:
+            return 100
+        return quality
+
+class RSSIRecord( PooledRecord ):
+    '''
+    RSSIRecord - A device record carrying an RSSI block at RSSI_OFFSET, which
+    subclasses set along with RECORD_SIZE.
+    '''
+    RSSI_OFFSET         = 0
+    HISTORY_INTERVAL_MS = HISTORY_INTERVAL_MS
+
+    @property
+    def smoothed( self ):
+        '''
+        The exponentially smoothed RSSI, rounded to a whole dB.
+        '''
+        return (getInt16( self._buf, self._off+self.RSSI_OFFSET+_RSSI_EWMA ) + 8) >> 4
+
+    @property
+    def history( self ):
+        '''
+        An RSSIHistory onto the samples kept in the record.
+        '''
+        return RSSIHistory( self._buf, self._off+self.RSSI_OFFSET )
+
+    def addSample( self, rssi ):
+        '''
+        Smooth in a new RSSI and add it to the history.
+        '''
+        rssiAdd( self._buf, self._off+self.RSSI_OFFSET, rssi, self.HISTORY_INTERVAL_MS // HISTORY_TICK_MS )
@@ -0,0 +1,341 @@
+#
+# ScanLog - an append only log, on flash, of the networks and bluetooth devices seen.
+#
+# The log is a header followed by fixed size records, all little endian:
+#
+#   Header (one record long)
+#       0   4 bytes     magic, b"NMLG"
+#       4   u16         format version
+#       6   u16         record size
+#       8   u32         time the log was started (time.time())
+#       12  4 bytes     reserved
+#
+#   Record
+#       0   u32         time of the observation (time.time())
+#       4   6 bytes     BSSID or bluetooth address
+#       10  i8          RSSI
+#       11  u8          channel, 0 for bluetooth
+#       12  u8          kind, LOG_WIFI or LOG_BLE
+#       13  u8          wifi: security, bluetooth: address type << 4 | advertisement type
+#       14  u16         low 16 bits of the crc32 of the SSID or of the advertisement data
+#
+#   Session record, kind LOG_BOOT, written first in each log a session writes to
+#       0   u32         time the log was opened (time.time())
+#       4   u32         session number, one more than the last session logged
+#       8   4 bytes     zero
+#       12  u8          kind, LOG_BOOT
+#       13  3 bytes     zero
+#
+# The Pico has no battery backed clock, so after a reboot time.time() starts again
+# from 2021 until something sets the clock.  The session records mark where one run
+# ends and the next begins, and the reader tags each record with its session.
+#
+# Records are gathered in a block buffer and written a block at a time, which keeps
+# both the flash wear and the time spent writing down.  Once a log reaches maxBytes it
+# is rotated: path becomes path.1, path.1 becomes path.2 and so on, keeping files logs.
+#
+# Unless maxBytes is given it is sized from the free space on the filesystem, so that the
+# current log and the rotated ones leave LOG_HEADROOM free, and is never more than
+# LOG_MAX_BYTES.  A block that cannot be written (the flash is full, say) is dropped and
+# counted in failures, rather than taking the log task down.  If the failed write left
+# part of a record behind, or the power went in the middle of one, the log is rotated
+# rather than appended to, so the records that follow stay aligned.
+#
+# Run under CPython to turn logs into CSV or JSON:
+#
+#   python3 scanlog.py [--json] scan.log [scan.log.1 ...]
+#
+import os
+import time
+import binascii
+
+from recordpool import getInt8, setInt8, getUInt16, setUInt16, getUInt32, setUInt32, setBytes
+
+LOG_WIFI = 0
+LOG_BLE  = 1
+LOG_BOOT = 2
+
+_MAGIC        = b"NMLG"
+_VERSION      = 2
+_KINDS        = ("wifi", "ble", "boot")
+
+_LOG_TIME     = 0
+_LOG_ADDR     = 4
+_LOG_RSSI     = 10
+_LOG_CHANNEL  = 11
+_LOG_KIND     = 12
+_LOG_TYPE     = 13
+_LOG_HASH     = 14
+_LOG_SIZE     = 16
+
+LOG_MAX_BYTES = 64 * 1024       # largest a log grows to before it is rotated
+LOG_MIN_BYTES = 4 * 1024        # smallest, however little space is free
+LOG_HEADROOM  = 128 * 1024      # flash left free for the program and its settings
+
+class ScanLog:
+    '''
+    ScanLog - The writer.  Nothing reaches the flash until a block of records has
+    been gathered, flush() is called, or flushStale() finds the oldest record
+    waiting has waited longer than maxWait_ms.
+    '''
+    def __init__( self, path="scan.log", maxBytes=None, files=2, blockRecords=32, maxWait_ms=60000 ):
+        '''
+        Parameters:
+            path         - Path of the log
+            maxBytes     - Size at which the log is rotated, None to size it from the
+                           space free on the filesystem
+            files        - Number of rotated logs kept besides the current one
+            blockRecords - Number of records written together
+            maxWait_ms   - Longest a record waits in the buffer, see flushStale
+        '''
+        self.path     = path
+        self.files    = files
+        self.block    = bytearray( blockRecords * _LOG_SIZE )
+        self.view     = memoryview( self.block )
+        self.capacity = blockRecords
+        self.pending  = 0
+        self.oldest   = 0           # ticks_ms of the first record waiting
+        self.maxWait  = maxWait_ms
+        self.records  = 0           # records written to flash
+        self.writes   = 0           # blocks written to flash
+        self.rotations = 0
+        self.failures = 0           # blocks dropped because they could not be written
+        self.size     = self._fileSize( path )
+        self.maxBytes = self._defaultMax() if maxBytes is None else maxBytes
+        if self.size % _LOG_SIZE:
+            self._rotate()
+        self.started  = int( time.time() )
+        self.session  = self._lastSession() + 1
+        self.marked   = False       # the session record is in the current log
+
+    def _fileSize( self, path ):
+        try:
+            return os.stat( path )[6]
+        except OSError:
+            return 0
+
+    def _defaultMax( self ):
+        '''
+        Returns:
+            The size to rotate at, an equal share for the current log and each rotated
+            one of the space free, counting the space the logs already take, less
+            LOG_HEADROOM.
+        '''
+        folder = self.path.rpartition( "/" )[0] or "."
+        try:
+            stat = os.statvfs( folder )
+        except (OSError, AttributeError):
+            return LOG_MAX_BYTES
+        free = stat[0] * stat[3] + self.size
+        for i in range( 1, self.files + 1 ):
+            free += self._fileSize( f"{self.path}.{i}" )
+        share = (free - LOG_HEADROOM) // (self.files + 1)
+        return max( LOG_MIN_BYTES, min( LOG_MAX_BYTES, share ) )
+
+    def _lastSession( self ):
+        '''
+        Returns:
+            The number of the last session in the newest log holding one, or 0 if
+            none does.
+        '''
+        for i in range( 0, self.files + 1 ):
+            path    = self.path if i == 0 else f"{self.path}.{i}"
+            session = None
+            try:
+                with open( path, "rb" ) as file:
+                    length = file.readinto( self.block )
+                    if length < _LOG_SIZE or self.block[0:4] != _MAGIC or getUInt16( self.block, 6 ) != _LOG_SIZE:
+                        continue
+                    offset = _LOG_SIZE
+                    while length:
+                        for record in range( offset, length - _LOG_SIZE + 1, _LOG_SIZE ):
+                            if self.block[record+_LOG_KIND] == LOG_BOOT:
+                                session = getUInt32( self.block, record+_LOG_ADDR )
+                        offset = 0
+                        length = file.readinto( self.block )
+            except OSError:
+                continue
+            if session is not None:
+                return session
+        return 0
+
+    def _sessionRecord( self ):
+        record = bytearray( _LOG_SIZE )
+        setUInt32( record, _LOG_TIME, self.started )
+        setUInt32( record, _LOG_ADDR, self.session )
+        record[_LOG_KIND] = LOG_BOOT
+        return record
+
+    def _header( self ):
+        header = bytearray( _LOG_SIZE )
+        header[0:4] = _MAGIC
+        setUInt16( header, 4, _VERSION )
+        setUInt16( header, 6, _LOG_SIZE )
+        setUInt32( header, 8, int( time.time() ) )
+        return header
+
+    def _rotate( self ):
+        '''
+        Move the logs along one place, dropping the oldest, so that a new log can be
+        started.
+        '''
+        for i in range( self.files, 0, -1 ):
+            older = f"{self.path}.{i}"
+            newer = self.path if i == 1 else f"{self.path}.{i-1}"
+            try:
+                if i == self.files:
+                    os.remove( older )
+            except OSError:
+                pass
+            try:
+                os.rename( newer, older )
+            except OSError:
+                pass
+        self.size   = 0
+        self.marked = False
+        self.rotations += 1
+
+    def record( self, kind, addr, rssi, channel, subtype, digest ):
+        '''
+        Add a record to the block buffer, writing the block out once it is full.
+        '''
+        if self.pending == 0:
+            self.oldest = time.ticks_ms()
+        offset = self.pending * _LOG_SIZE
+        block  = self.block
+        setUInt32( block, offset+_LOG_TIME, int( time.time() ) )
+        setBytes( block, offset+_LOG_ADDR, addr, 6 )
+        setInt8( block, offset+_LOG_RSSI, rssi )
+        block[offset+_LOG_CHANNEL] = channel
+        block[offset+_LOG_KIND]    = kind
+        block[offset+_LOG_TYPE]    = subtype
+        setUInt16( block, offset+_LOG_HASH, digest )
+        self.pending += 1
+        if self.pending == self.capacity:
+            self.flush()
+
+    def logWLAN( self, lan ):
+        '''
+        Log an observation of a network (a WLAN).
+        '''
+        self.record( LOG_WIFI, lan.rawBSSID, lan.rssi, lan.channel, lan.security,
+                     binascii.crc32( lan.ssid.encode() ) & 0xFFFF )
+
+    def logBLE( self, item ):
+        '''
+        Log an observation of a bluetooth device (a BLEItem).
+        '''
+        self.record( LOG_BLE, item.rawAddr, item.rssi, 0, (item.addr_type << 4) | item.adv_type,
+                     item.advCRC & 0xFFFF )
+
+    def flush( self ):
+        '''
+        Write whatever records are waiting to the log, in a single write.  If the
+        write fails the records are dropped and the failure counted, and if it left
+        part of a record behind the log is rotated.  The first write of a session to
+        a log is preceded by the session record.
+        '''
+        if self.pending == 0:
+            return
+        if self.size >= self.maxBytes:
+            self._rotate()
+        length = self.pending * _LOG_SIZE
+        try:
+            with open( self.path, "ab" ) as file:
+                if self.size == 0:
+                    file.write( self._header() )
+                    self.size = _LOG_SIZE
+                if not self.marked:
+                    file.write( self._sessionRecord() )
+                    self.size += _LOG_SIZE
+                file.write( self.view[:length] )
+        except OSError as e:
+            print( f"Scan log write failed: {e}" )
+            self.failures += 1
+            self.size     = self._fileSize( self.path )
+            self.pending  = 0
+            if self.size % _LOG_SIZE:
+                self._rotate()
+            return
+        self.size    += length
+        self.marked   = True
+        self.records += self.pending
+        self.writes  += 1
+        self.pending  = 0
+
+    def flushStale( self ):
+        '''
+        Flush the records waiting if the oldest has waited more than maxWait_ms, so
+        little is lost if the power goes.
+        '''
+        if self.pending and time.ticks_diff( time.ticks_ms(), self.oldest ) >= self.maxWait:
+            self.flush()
+
+    def stats( self ):
+        return { "records"   : self.records,
+                 "pending"   : self.pending,
+                 "writes"    : self.writes,
+                 "rotations" : self.rotations,
+                 "failures"  : self.failures,
+                 "session"   : self.session,
+                 "bytes"     : self.size,
+                 "maxBytes"  : self.maxBytes }
+
+def readLog( path ):
+    '''
+    Read a log, one record at a time.  Session records come through with kind
+    "boot" and an empty address, and every record carries the number of the
+    session it was written in, None if it precedes any session record (as in logs
+    from before they were written).
+
+    Returns:
+        A generator of (time, kind, address hex, rssi, channel, type, hash,
+        session) tuples.
+    '''
+    with open( path, "rb" ) as file:
+        header = file.read( _LOG_SIZE )
+        if len(header) < _LOG_SIZE or header[0:4] != _MAGIC:
+            raise ValueError( f"{path} is not a scan log" )
+        size    = getUInt16( header, 6 )
+        session = None
+        while True:
+            record = file.read( size )
+            if len(record) < size:
+                return
+            kind = record[_LOG_KIND]
+            if kind == LOG_BOOT:
+                session = getUInt32( record, _LOG_ADDR )
+                yield ( getUInt32( record, _LOG_TIME ), "boot", "", 0, 0, 0, 0, session )
+                continue
+            yield ( getUInt32( record, _LOG_TIME ),
+                    _KINDS[kind] if kind < len(_KINDS) else str( kind ),
+                    bytes( record[_LOG_ADDR:_LOG_ADDR+6] ).hex(),
+                    getInt8( record, _LOG_RSSI ),
+                    record[_LOG_CHANNEL],
+                    record[_LOG_TYPE],
+                    getUInt16( record, _LOG_HASH ),
+                    session )
+
+FIELDS = ("time", "kind", "address", "rssi", "channel", "type", "hash", "session")
+
+if __name__ == "__main__":
+    import argparse
+    import csv
+    import json
+    import sys
+
+    parser = argparse.ArgumentParser( description="Turn NetMonitor scan logs into CSV or JSON" )
+    parser.add_argument( "logs", nargs="+", help="logs to read, oldest first" )
+    parser.add_argument( "--json", action="store_true", help="write JSON lines instead of CSV" )
+    args = parser.parse_args()
+
+    writer = None
+    if not args.json:
+        writer = csv.writer( sys.stdout )
+        writer.writerow( FIELDS )
+    for path in args.logs:
+        for record in readLog( path ):
+            if writer is None:
+                print( json.dumps( dict( zip( FIELDS, record ) ) ) )
+            else:
+                writer.writerow( record )
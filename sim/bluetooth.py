@@ -0,0 +1,36 @@
+#
+# Host stand-in for the MicroPython bluetooth module.  While a scan is running
+# the current simulation (see simulator.py) calls the IRQ handler with scan
+# results from a thread of its own.
+#
+import hostpatch
+import simulator
+
+_IRQ_SCAN_DONE = 6
+
+class BLE:
+    def __init__( self ):
+        self._active = False
+        self._irq    = None
+        
+    def active( self, value=None ):
+        if value is not None:
+            self._active = value
+        return self._active
+    
+    def irq( self, handler ):
+        self._irq = handler
+        
+    def config( self, name ):
+        if name == 'mac':
+            return (0, b'\x28\xcd\xc1\x00\x00\x01')
+        return None
+    
+    def gap_scan( self, duration_ms, interval_us=1280000, window_us=11250, active=False ):
+        simulation = simulator.current()
+        if duration_ms is None:
+            simulation.stopAdvertising()
+            if self._irq is not None:
+                self._irq( _IRQ_SCAN_DONE, None )
+        else:
+            simulation.startAdvertising( self, active, window_us / interval_us )
@@ -0,0 +1,81 @@
+#
+# Host patches - give CPython's time, gc and asyncio modules the MicroPython
+# only functions the NetMonitor code uses.  Imported by every stand-in module
+# in sim/, so the patches are in place before any NetMonitor module runs.
+#
+import time
+import gc
+import asyncio
+
+_start = time.monotonic_ns()
+
+def _ticks_ms():
+    return ((time.monotonic_ns() - _start) // 1000000) & 0x3FFFFFFF
+
+def _ticks_us():
+    return ((time.monotonic_ns() - _start) // 1000) & 0x3FFFFFFF
+
+def _ticks_add( ticks, delta ):
+    return (ticks + delta) & 0x3FFFFFFF
+
+def _ticks_diff( ticks1, ticks2 ):
+    diff = (ticks1 - ticks2) & 0x3FFFFFFF
+    if diff >= 0x20000000:
+        diff -= 0x40000000
+    return diff
+
+def _sleep_ms( ms ):
+    time.sleep( ms / 1000 )
+
+#
+# The host has no fixed size heap, so report one.  A simulation can move
+# heapUsed around to exercise the low memory paths.
+#
+HEAP_SIZE = 200 * 1024
+heapUsed  = 80 * 1024
+
+def _mem_alloc():
+    return heapUsed
+
+def _mem_free():
+    return HEAP_SIZE - heapUsed
+
+class _ThreadSafeFlag:
+    '''
+    asyncio.ThreadSafeFlag, a flag that can be set from another thread (the
+    stand-in for an interrupt handler) and waited on by one task.
+    '''
+    def __init__( self ):
+        self._set   = False
+        self._loop  = None
+        self._event = None
+        
+    def set( self ):
+        self._set = True
+        loop = self._loop
+        if loop is not None:
+            loop.call_soon_threadsafe( self._event.set )
+            
+    def clear( self ):
+        self._set = False
+        
+    async def wait( self ):
+        if self._event is None:
+            self._event = asyncio.Event()
+            self._loop  = asyncio.get_running_loop()
+        while not self._set:
+            await self._event.wait()
+            self._event.clear()
+        self._set = False
+
+if not hasattr( asyncio, "ThreadSafeFlag" ):
+    asyncio.ThreadSafeFlag = _ThreadSafeFlag
+
+for name, function in (("ticks_ms", _ticks_ms), ("ticks_us", _ticks_us), ("ticks_add", _ticks_add),
+                       ("ticks_diff", _ticks_diff), ("sleep_ms", _sleep_ms)):
+    if not hasattr( time, name ):
+        setattr( time, name, function )
+        
+for name, function in (("mem_alloc", _mem_alloc), ("mem_free", _mem_free)):
+    if not hasattr( gc, name ):
+        setattr( gc, name, function )
@@ -0,0 +1,77 @@
+#
+# Host stand-in for the MicroPython machine module.
+#
+import time
+import threading
+import hostpatch
+
+_pins  = {}                 # pin number -> the Pin with an irq handler on it
+_wake  = threading.Event()  # set by a button edge, ends a lightsleep
+vsys   = 3.9                # volts read on VSYS
+
+def lightsleep( ms=None ):
+    '''
+    Sleep until the time is up or a button is pressed.
+    '''
+    _wake.wait( None if ms is None else ms / 1000 )
+    _wake.clear()
+
+def press( pin, hold=0.05, bounces=0 ):
+    '''
+    Press the button on the given pin, and let it go after hold seconds.  Called
+    from another thread, which stands in for the interrupts.
+    
+    Parameters:
+        pin     - Pin number
+        hold    - Seconds the button is held
+        bounces - Extra edges, a millisecond apart, after the press and after the release
+    '''
+    target = _pins.get( pin )
+    if target is None:
+        return
+    for level in (0, 1):
+        target._edge( level )
+        for i in range( bounces ):
+            time.sleep( 0.001 )
+            target._edge( 1 - level if i % 2 == 0 else level )
+        target._edge( level )
+        if level == 0:
+            time.sleep( hold )
+
+class Pin:
+    IN        = 0
+    OUT       = 1
+    PULL_UP   = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING  = 8
+    
+    def __init__( self, pin, mode=IN, pull=None, value=None ):
+        self.pin    = pin
+        self.mode   = mode
+        self._value = 1 if pull == Pin.PULL_UP else 0
+        if value is not None:
+            self._value = value
+            
+    def value( self, value=None ):
+        if value is None:
+            return self._value
+        self._value = value
+        
+    def irq( self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, hard=False ):
+        self._handler = handler
+        _pins[self.pin] = self
+        
+    def _edge( self, level ):
+        if level != self._value:
+            self._value = level
+            self._handler( self )
+            _wake.set()
+        
+class ADC:
+    def __init__( self, pin ):
+        self.pin = pin
+        
+    def read_u16( self ):
+        # VSYS through the 1/3 divider
+        return int( vsys / (3 * 3.3) * 65535 )
@@ -0,0 +1,14 @@
+#
+# Host stand-in for the MicroPython micropython module, so the NetMonitor code
+# can be imported and benchmarked under CPython.
+#
+import hostpatch
+
+def const( value ):
+    return value
+
+def schedule( function, arg ):
+    '''
+    There is no soft IRQ context on the host, run the function straight away.
+    '''
+    function( arg )
@@ -0,0 +1,24 @@
+#
+# Host stand-in for the MicroPython network module.  Scans are answered by the
+# current simulation (see simulator.py).
+#
+import hostpatch
+import simulator
+
+STA_IF = 0
+
+class WLAN:
+    def __init__( self, interface=STA_IF ):
+        self._active = False
+        
+    def active( self, value=None ):
+        if value is not None:
+            self._active = value
+        return self._active
+    
+    def scan( self, passive=False, ssid=None, essid=None, bssid=None ):
+        '''
+        Takes the same keywords as the cyw43 driver, anything else (channel= for
+        instance) raises TypeError as it does there.
+        '''
+        return simulator.current().wifiScan( ssid or essid, bssid )
@@ -0,0 +1,67 @@
+#
+# Host stand-in for Pimoroni's picographics module.  Nothing is drawn, the calls
+# are counted so that a run can report how much drawing each screen does.
+#
+import hostpatch
+
+DISPLAY_PICO_DISPLAY_2 = 1
+PEN_P4 = 4
+PEN_P8 = 8
+PEN_RGB565 = 16
+
+instances = []
+
+class PicoGraphics:
+    def __init__( self, display=DISPLAY_PICO_DISPLAY_2, rotate=0, pen_type=PEN_P4 ):
+        self.width  = 320
+        self.height = 240
+        self.pens   = []
+        self.pen    = 0
+        self.backlight = 1.0
+        self.counts = {}            # calls per primitive
+        self.pixelsPushed = 0
+        instances.append( self )
+        
+    def _count( self, name ):
+        self.counts[name] = self.counts.get( name, 0 ) + 1
+        
+    def set_font( self, font ):
+        pass
+    
+    def get_bounds( self ):
+        return self.width, self.height
+    
+    def create_pen( self, r, g, b ):
+        self.pens.append( (r, g, b) )
+        return len(self.pens) - 1
+    
+    def set_pen( self, pen ):
+        self._count( "set_pen" )
+        self.pen = pen
+        
+    def set_backlight( self, value ):
+        self.backlight = value
+        
+    def clear( self ):
+        self._count( "clear" )
+    
+    def update( self ):
+        self._count( "update" )
+        self.pixelsPushed += self.width * self.height
+    
+    def partial_update( self, x, y, w, h ):
+        self._count( "partial_update" )
+        self.pixelsPushed += w * h
+    
+    def text( self, text, x, y, wordwrap=None, scale=2, angle=0, spacing=1, fixed_width=False ):
+        self._count( "text" )
+    
+    def measure_text( self, text, scale=2, spacing=1, fixed_width=False ):
+        self._count( "measure_text" )
+        return len(text) * 6 * scale
+    
+    def rectangle( self, x, y, w, h ):
+        self._count( "rectangle" )
+    
+    def line( self, x1, y1, x2, y2 ):
+        self._count( "line" )
@@ -0,0 +1,12 @@
+#
+# Host stand-in for Pimoroni's pimoroni module.  The buttons are read through
+# machine.Pin (see buttons.py), so only the LED is needed.
+#
+import hostpatch
+
+class RGBLED:
+    def __init__( self, r, g, b, invert=True, gamma=1 ):
+        self.rgb = (0, 0, 0)
+        
+    def set_rgb( self, r, g, b ):
+        self.rgb = (r, g, b)
@@ -0,0 +1,106 @@
+#
+# Run NetMonitor on the host, using the stand-in hardware modules in sim/.
+#
+#   python3 sim/run.py [options] [button ...]
+#
+# Buttons (up, down, select, cancel, or wait) are pressed in order, --interval
+# seconds apart; a button may carry its own delay as name:seconds, and be held
+# down for longer than a tap as name@seconds (name@seconds:seconds for both).
+# Once they have all been pressed the run stops, printing a report with --report.
+#
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+SIM  = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(SIM)
+sys.path.insert(0, SIM)
+sys.path.insert(0, ROOT)
+
+import picographics
+import machine
+import simulator
+
+BUTTONS = { "up" : 12, "down" : 13, "select" : 14, "cancel" : 15 }
+
+def report( started, cpu ):
+    '''
+    Gather what the run did, from the stand-in modules and the NetMonitor globals.
+    '''
+    netmonitor = sys.modules.get( "netmonitor" )
+    simulation = simulator.current()
+    result = { "seconds"    : round( time.monotonic() - started, 3 ),
+               "cpuSeconds" : round( time.process_time() - cpu, 3 ),
+               "wifiScans"  : simulation.wifiScans,
+               "advertised" : simulation.advertised }
+    if picographics.instances:
+        graphics = picographics.instances[0]
+        result["primitives"]   = dict( graphics.counts )
+        result["pixelsPushed"] = graphics.pixelsPushed
+    if netmonitor is not None:
+        result["frames"] = netmonitor.display.frameStats()
+        results = netmonitor.scanner.get_scan_results()
+        result["bleDevices"]  = 0 if results is None else len(results)
+        result["bleDropped"]  = netmonitor.scanner.getOverflow()
+        result["bleStats"]    = netmonitor.scanner.getStats()
+        result["wlans"]       = len(netmonitor.wlanList)
+        result["wifiTargeted"] = netmonitor.wscanner.targetedScans
+        result["scanLog"]     = netmonitor.scanLog.stats()
+        result["gc"]          = netmonitor.memory.stats()
+        result["buttons"]     = netmonitor.display.buttons.stats()
+        result["power"]       = netmonitor.power.stats()
+    return result
+
+def pressButtons( names, interval, printReport, bounces ):
+    started = time.monotonic()
+    cpu     = time.process_time()
+    for name in names:
+        delay = interval
+        hold  = 0.05
+        if ":" in name:
+            name, delay = name.split( ":" )
+            delay = float( delay )
+        if "@" in name:
+            name, hold = name.split( "@" )
+            hold = float( hold )
+        time.sleep( delay )
+        if name in BUTTONS:
+            machine.press( BUTTONS[name], hold, bounces )
+    time.sleep( interval )
+    if printReport:
+        print( json.dumps( report( started, cpu ) ), flush=True )
+    os._exit( 0 )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description="Run NetMonitor against simulated hardware" )
+    parser.add_argument( "buttons", nargs="*", help="up, down, select, cancel or wait, optionally name:seconds" )
+    parser.add_argument( "--interval",  type=float, default=0.25, help="seconds between button presses" )
+    parser.add_argument( "--aps",       type=int,   default=8,    help="synthetic access points" )
+    parser.add_argument( "--ble",       type=int,   default=20,   help="synthetic bluetooth devices" )
+    parser.add_argument( "--rate",      type=float, default=50,   help="synthetic advertisements per second" )
+    parser.add_argument( "--scan-time", type=float, default=0.0,  help="seconds a wifi scan blocks for" )
+    parser.add_argument( "--recording", help="replay a recording instead of synthetic traffic" )
+    parser.add_argument( "--speed",     type=float, default=1.0,  help="replay speed of a recording" )
+    parser.add_argument( "--seed",      type=int,   default=1 )
+    parser.add_argument( "--bounce",    type=int,   default=0,    help="contact bounces on every press and release" )
+    parser.add_argument( "--battery",   type=float, default=3.9,  help="volts on VSYS, 4.2 and over reads as charging" )
+    parser.add_argument( "--report",    action="store_true", help="print a JSON report when done" )
+    parser.add_argument( "--partial-update", action="store_true", help="push regions with partial_update, see Display.PARTIAL_UPDATE" )
+    parser.add_argument( "--flash",     help="directory standing in for the flash filesystem, a temporary one by default" )
+    args = parser.parse_args()
+
+    simulator.install( simulator.Simulation( aps=args.aps, bleDevices=args.ble, advRate=args.rate,
+                                             wifiScanTime=args.scan_time, recording=args.recording,
+                                             speed=args.speed, seed=args.seed ) )
+    machine.vsys = args.battery
+    os.chdir( args.flash or tempfile.mkdtemp( prefix="netmonitor-" ) )
+    if args.buttons:
+        threading.Thread( target=pressButtons, args=(args.buttons, args.interval, args.report, args.bounce), daemon=True ).start()
+    if args.partial_update:
+        import display
+        display.Display.PARTIAL_UPDATE = True
+    import netmonitor
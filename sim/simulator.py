@@ -0,0 +1,169 @@
+#
+# Simulation - the traffic the stand-in network and bluetooth modules produce.
+#
+# A simulation is either synthetic (a number of access points and bluetooth devices
+# with wandering signal strengths) or replays a recording.  A recording is a JSON
+# file:
+#
+#   { "wifi" : [ [ [ssid, bssid hex, channel, rssi, security, hidden], ... ], ... ],
+#     "ble"  : [ [ms, addr type, addr hex, adv type, rssi, adv data hex], ... ] }
+#
+# where "wifi" is a list of scans, handed out in turn, and "ble" a time ordered
+# list of advertisements, replayed at their recorded times (scaled by speed).
+#
+import hostpatch
+import json
+import random
+import threading
+import time
+
+_IRQ_SCAN_RESULT = 5
+_IRQ_SCAN_DONE   = 6
+
+class Simulation:
+    def __init__( self, aps=8, bleDevices=20, advRate=50, wifiScanTime=0.0, recording=None, speed=1.0, seed=1 ):
+        '''
+        Parameters:
+            aps          - Number of synthetic access points
+            bleDevices   - Number of synthetic bluetooth devices
+            advRate      - Synthetic advertisements per second, over all devices
+            wifiScanTime - Seconds a wifi scan blocks for
+            recording    - Path of a recording to replay instead of synthetic traffic
+            speed        - Replay speed of a recording
+            seed         - Seed for the synthetic traffic
+        '''
+        self.random       = random.Random( seed )
+        self.advRate      = advRate
+        self.wifiScanTime = wifiScanTime
+        self.speed        = speed
+        self.wifiScans    = 0
+        self.advertised   = 0
+        self.recorded     = None
+        if recording is not None:
+            with open( recording ) as file:
+                self.recorded = json.load( file )
+            self.scanIndex = 0
+        self.aps     = [ self._makeAP( i ) for i in range( aps ) ]
+        self.devices = [ self._makeDevice( i ) for i in range( bleDevices ) ]
+        self._stop   = None
+
+    def _makeAP( self, i ):
+        rnd  = self.random
+        ssid = b"" if rnd.random() < 0.1 else ("Net-%d" % (i // 2)).encode()
+        return [ ssid, bytes( [0x02, 0x11, 0x22, 0x33, i >> 8, i & 0xFF] ), rnd.choice( (1, 6, 11, 36, 44) ),
+                 float( rnd.randrange( -90, -35 ) ), rnd.randrange( 8 ), 1 if ssid == b"" else 0 ]
+
+    def _makeDevice( self, i ):
+        rnd = self.random
+        adv = bytearray( [2, 0x01, 0x06] )
+        if rnd.random() < 0.4:
+            name = ("Device-%d" % i).encode()
+            adv += bytes( [len(name) + 1, 0x09] ) + name
+        if rnd.random() < 0.3:
+            adv += bytes( [3, 0x02, 0xAF, 0xFE] )
+        room = 31 - len(adv) - 2
+        if room > 2:
+            size = rnd.randrange( 2, room + 1 )
+            adv += bytes( [size + 1, 0xFF] ) + bytes( rnd.randrange( 256 ) for _ in range( size ) )
+        addr = bytes( rnd.randrange( 256 ) for _ in range( 6 ) )
+        return [ rnd.randrange( 2 ), addr, rnd.choice( (0, 0, 0, 3) ), float( rnd.randrange( -95, -40 ) ), bytes( adv ) ]
+
+    def _wander( self, rssi ):
+        rssi += self.random.uniform( -3, 3 )
+        return min( -30.0, max( -99.0, rssi ) )
+
+    def wifiScan( self, ssid=None, bssid=None ):
+        '''
+        Produce the result of one wifi scan, as network.WLAN.scan() returns it,
+        only the access points matching ssid and bssid if they are given.
+        '''
+        results = self._wifiScan()
+        if ssid is not None:
+            if isinstance( ssid, str ):
+                ssid = ssid.encode()
+            results = [ w for w in results if w[0] == ssid ]
+        if bssid is not None:
+            results = [ w for w in results if w[1] == bytes( bssid ) ]
+        return results
+
+    def _wifiScan( self ):
+        if self.wifiScanTime:
+            time.sleep( self.wifiScanTime )
+        self.wifiScans += 1
+        if self.recorded is not None:
+            scans = self.recorded.get( "wifi", [] )
+            if not scans:
+                return []
+            scan = scans[self.scanIndex % len(scans)]
+            self.scanIndex += 1
+            return [ (w[0].encode(), bytes.fromhex( w[1] ), w[2], w[3], w[4], w[5]) for w in scan ]
+        results = []
+        for ap in self.aps:
+            ap[3] = self._wander( ap[3] )
+            if ap[3] > -95:
+                results.append( (ap[0], ap[1], ap[2], int( ap[3] ), ap[4], ap[5]) )
+        return results
+
+    def startAdvertising( self, ble, active, duty=1.0 ):
+        '''
+        Start feeding advertisements to the BLE object's IRQ handler from a thread,
+        the same way the real stack calls it.  Only the duty share of the synthetic
+        advertisements is heard, the rest come while the scan window is closed.
+        '''
+        self.stopAdvertising()
+        self.duty  = duty
+        self._stop = threading.Event()
+        if self.recorded is not None:
+            target = self._replay
+        else:
+            target = self._synthesize
+        threading.Thread( target=target, args=( ble, active, self._stop ), daemon=True ).start()
+
+    def stopAdvertising( self ):
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+
+    def _deliver( self, ble, addr_type, addr, adv_type, rssi, adv ):
+        if ble._irq is not None:
+            self.advertised += 1
+            ble._irq( _IRQ_SCAN_RESULT, ( addr_type, memoryview( addr ), adv_type, rssi, memoryview( adv ) ) )
+
+    def _synthesize( self, ble, active, stop ):
+        tick  = 0.01
+        owed  = 0.0
+        while not stop.is_set() and self.devices:
+            owed += self.advRate * self.duty * tick
+            while owed >= 1:
+                owed -= 1
+                device = self.random.choice( self.devices )
+                device[3] = self._wander( device[3] )
+                self._deliver( ble, device[0], device[1], device[2], int( device[3] ), device[4] )
+            time.sleep( tick )
+
+    def _replay( self, ble, active, stop ):
+        events = self.recorded.get( "ble", [] )
+        while not stop.is_set() and events:
+            start = time.monotonic()
+            for ms, addr_type, addr, adv_type, rssi, adv in events:
+                delay = ms / 1000 / self.speed - (time.monotonic() - start)
+                if delay > 0:
+                    time.sleep( delay )
+                if stop.is_set():
+                    return
+                self._deliver( ble, addr_type, bytes.fromhex( addr ), adv_type, rssi, bytes.fromhex( adv ) )
+
+_current = None
+
+def current():
+    '''
+    The simulation in use, a small synthetic one unless install() was called.
+    '''
+    global _current
+    if _current is None:
+        _current = Simulation()
+    return _current
+
+def install( simulation ):
+    global _current
+    _current = simulation
@@ -2,19 +2,129 @@ import time
 import machine
 import network
 import binascii
+import asyncio
+
+try:
+    import _thread
+except ImportError:
+    _thread = None
+
+from micropython import const
+from recordpool import RecordPool, BoundedList, getInt8, setInt8, getUInt16, setUInt16, getUInt32, setUInt32, setBytes
+from rssitools import RSSIRecord, RSSI_SIZE
+from displayhelper import ListModel, rssiColor
+
+# Layout of a WLAN record
+_WLAN_BSSID    = const(0)           # 6 byte raw BSSID
+_WLAN_CHANNEL  = const(6)
+_WLAN_RSSI     = const(7)
+_WLAN_SECURITY = const(8)
+_WLAN_HIDDEN   = const(9)
+_WLAN_COUNT    = const(10)          # 16 bits
+_WLAN_SEEN     = const(12)          # 32 bits, time.ticks_ms() of the last scan that saw it
+_WLAN_SSID_LEN = const(16)
+_WLAN_SSID     = const(17)          # up to 32 bytes
+_WLAN_SSID_MAX = const(32)
+_WLAN_HISTORY  = const(49)          # RSSI_SIZE bytes of smoothed RSSI and history, see rssitools.py
+_WLAN_SIZE     = _WLAN_HISTORY + RSSI_SIZE
 
 #
 # wlan - A class that contains a WLAN we are aware of.
 #
-class WLAN:
+# The values are packed into a single record.  While the WLAN is held by a WLANList the
+# record lives in the list's RecordPool, otherwise in a small buffer of its own.  The
+# record also carries the smoothed RSSI and a history of the recent RSSI, filled by every
+# scan the network is seen in.
+#
+class WLAN( RSSIRecord ):
+    RECORD_SIZE = _WLAN_SIZE
+    RSSI_OFFSET = _WLAN_HISTORY
+
     def __init__(self,ssid,bssid,channel,rssi,security,hidden):
-        self.ssid     = ssid
-        self.bssid    = bssid
+        '''
+        Parameters:
+            ssid     - SSID, either as a string or the raw bytes from a scan
+            bssid    - BSSID, either as a hex string or the raw 6 bytes from a scan
+            channel  - Channel number
+            rssi     - Received signal strength in dBm
+            security - Security mode as reported by the scan
+            hidden   - True if this is a hidden network
+        '''
+        self.newRecord()
+        if isinstance( ssid, str ):
+            ssid = ssid.encode()
+        if isinstance( bssid, str ):
+            bssid = binascii.unhexlify( bssid )
+        self._buf[_WLAN_SSID_LEN] = setBytes( self._buf, _WLAN_SSID, ssid, _WLAN_SSID_MAX )
+        setBytes( self._buf, _WLAN_BSSID, bssid, 6 )
         self.channel  = channel
         self.rssi     = rssi
         self.security = security
         self.hidden   = hidden
-        self.count    = 0
+        self.lastSeen = time.ticks_ms()
+        self.addSample( rssi )
+        self.version  = 0       # bumped whenever what the listbox shows changes
+        
+    @property
+    def ssid( self ):
+        length = self._buf[self._off+_WLAN_SSID_LEN]
+        return bytes( self._buf[self._off+_WLAN_SSID:self._off+_WLAN_SSID+length] ).decode()
+    
+    @property
+    def rawBSSID( self ):
+        return bytes( self._buf[self._off+_WLAN_BSSID:self._off+_WLAN_BSSID+6] )
+    
+    @property
+    def bssid( self ):
+        return binascii.hexlify( self.rawBSSID ).decode()
+    
+    @property
+    def channel( self ):
+        return self._buf[self._off+_WLAN_CHANNEL]
+    
+    @channel.setter
+    def channel( self, value ):
+        self._buf[self._off+_WLAN_CHANNEL] = value
+        
+    @property
+    def rssi( self ):
+        return getInt8( self._buf, self._off+_WLAN_RSSI )
+    
+    @rssi.setter
+    def rssi( self, value ):
+        setInt8( self._buf, self._off+_WLAN_RSSI, value )
+        
+    @property
+    def security( self ):
+        return self._buf[self._off+_WLAN_SECURITY]
+    
+    @security.setter
+    def security( self, value ):
+        self._buf[self._off+_WLAN_SECURITY] = value
+        
+    @property
+    def hidden( self ):
+        return self._buf[self._off+_WLAN_HIDDEN]
+    
+    @hidden.setter
+    def hidden( self, value ):
+        self._buf[self._off+_WLAN_HIDDEN] = value
+        
+    @property
+    def count( self ):
+        return getUInt16( self._buf, self._off+_WLAN_COUNT )
+    
+    @count.setter
+    def count( self, value ):
+        setUInt16( self._buf, self._off+_WLAN_COUNT, value )
+        
+    @property
+    def lastSeen( self ):
+        return getUInt32( self._buf, self._off+_WLAN_SEEN )
+    
+    @lastSeen.setter
+    def lastSeen( self, value ):
+        setUInt32( self._buf, self._off+_WLAN_SEEN, value )
         
     def getSSID( self, width=24 ):
         ssid = self.ssid[:24]
@@ -39,21 +149,72 @@ class WLAN:
         if self.ssid == "":
             msg = f"{self.getBSSID()}"
         else: 
-            msg = f"{self.getSSID()}\t{self.channel:>2}\t{self.rssi:>3}"
+            msg = f"{self.getSSID()}\t{self.channel:>2}\t{self.smoothed:>3}"
         return msg
 
     def __repr__( self ):
         return f"WLAN(\"{self.ssid}\", {self.bssid}, {self.channel}, {self.rssi}, {self.security}, {self.hidden} )"
         
+#
+# Orderings for WLANList.setOrder.  Each is a key function, and whether the list is kept
+# in descending order of that key.
+#
+def rssiOrder( lan ):
+    return lan.smoothed
+
+def channelOrder( lan ):
+    return lan.channel
+
+def ssidOrder( lan ):
+    return lan.ssid.lower()
+
+def securityOrder( lan ):
+    return lan.security
+
+ORDER_RSSI      = (rssiOrder,     True)
+ORDER_CHANNEL   = (channelOrder,  False)
+ORDER_SSID      = (ssidOrder,     False)
+ORDER_SECURITY  = (securityOrder, False)
+
+SCAN_POLL_MS    = 50            # how often a running scan is checked for results
+RSSI_HYSTERESIS = 3             # dB an RSSI has to move before a network changes place
+
 #
 # WLANList - This class is used to create a list of the WLAN's we have seen during a scan.
 #
 # This class supports being itereated, printed, and supports random access and obtaining the length.
+# Every access point is its own entry, indexed by BSSID, with a second index from SSID to the
+# BSSIDs of the access points sharing that SSID.
+#
+# The list is kept in order as items are added and updated: only an item whose key changed is
+# moved, by binary search on the key each item was last placed with.  Numeric keys have to move
+# by at least the hysteresis before the item changes place, so rows don't jitter on the screen.
+#
+# The list can be bounded, by a number of networks or by a floor on gc.mem_free(), see
+# BoundedList.  The pinned network (the one being watched) is not aged out either.
+#
+# The list is the listbox's model, so only the networks on screen are formatted.
 #
-class WLANList:
-    def __init__( self ):
+class WLANList(ListModel, BoundedList):
+    def __init__( self, maxItems=0, memFloor=0, collect=None ):
+        '''
+        Parameters:
+            maxItems - Most networks kept, 0 for no limit
+            memFloor - Evict networks when adding one finds less free memory than this, 0 for never
+            collect  - Function that runs a collection, see BoundedList
+        '''
         self.wlanlist = []
+        self.table    = {}      # raw BSSID -> WLAN
+        self.ssids    = {}      # SSID      -> [raw BSSID, ...]
+        self.pool     = RecordPool( _WLAN_SIZE, 16 )
+        self.sortKey  = {}      # WLAN -> key it was placed in the list with
+        self.keyFunction = rssiOrder
+        self.reverse     = True
+        self.hysteresis  = RSSI_HYSTERESIS
+        self.moves    = 0       # number of times an item changed place
         self.count    = 0
+        self.version  = 0       # bumped every time the contents of the list change
+        self.bound( maxItems, memFloor, collect )
         
     def __iter__(self):
         '''
@@ -89,28 +250,273 @@ class WLANList:
         '''
         return len(self.wlanlist)
     
+    def rowCount( self ):
+        return len(self.wlanlist)
+    
+    def rowItem( self, index ):
+        return self.wlanlist[index]
+    
+    def rowText( self, index ):
+        return str(self.wlanlist[index])
+    
+    def rowColor( self, index ):
+        return rssiColor( self.wlanlist[index].smoothed )
+    
+    def rowVersion( self, index ):
+        return self.wlanlist[index].version
+    
+    def rowKey( self, index ):
+        return self.wlanlist[index].rawBSSID
+    
+    def rowIndex( self, key, hint=-1 ):
+        '''
+        Find the row of a network by its raw BSSID, see indexOf.
+        '''
+        item = self.table.get( key )
+        if item is None:
+            return -1
+        if 0 <= hint < len(self.wlanlist) and self.wlanlist[hint] is item:
+            return hint
+        return self.indexOf( item )
+    
     def __repr__( self ):
         data = f"WLANList( {self.count}, {self.wlanlist})"
         return data
     
+    def get( self, bssid ):
+        '''
+        get - Obtain the access point with the given BSSID (raw bytes or a hex string), or None
+              if we have not seen it.
+        '''
+        if isinstance( bssid, str ):
+            bssid = binascii.unhexlify( bssid )
+        return self.table.get( bssid )
+    
+    def getBySSID( self, ssid ):
+        '''
+        getBySSID - Obtain every access point we have seen for an SSID.
+        '''
+        return [self.table[bssid] for bssid in self.ssids.get( ssid, () )]
+    
+    def groupBySSID( self ):
+        '''
+        groupBySSID - Group the access points by SSID, using the SSID index rather than walking
+                      the list.  Hidden networks have no SSID to group on, so each is a group
+                      of its own.
+                      
+        Returns:
+            A list of lists of WLANs, the access points within a group strongest first, and the
+            groups ordered by their strongest access point.
+        '''
+        groups = []
+        for ssid, bssids in self.ssids.items():
+            group = [self.table[bssid] for bssid in bssids]
+            group.sort( reverse=True, key=self.defaultSort )
+            if ssid == "":
+                for lan in group:
+                    groups.append( [lan] )
+            else:
+                groups.append( group )
+        groups.sort( reverse=True, key=lambda group: group[0].rssi )
+        return groups
+    
+    def setOrder( self, order, hysteresis=None ):
+        '''
+        setOrder - Choose the order the list is kept in.  The list is sorted once, after that
+                   the order is maintained as items are added and updated.
+                   
+        Parameters:
+            order      - One of the ORDER_* values, or a (keyFunction, reverse) tuple
+            hysteresis - How far a numeric key has to move before the item changes place,
+                         defaults to RSSI_HYSTERESIS for ORDER_RSSI and 0 otherwise
+        '''
+        self.keyFunction, self.reverse = order
+        if hysteresis is None:
+            hysteresis = RSSI_HYSTERESIS if order == ORDER_RSSI else 0
+        self.hysteresis = hysteresis
+        for item in self.wlanlist:
+            self.sortKey[item] = self.keyFunction( item )
+        self.wlanlist.sort( reverse=self.reverse, key=self.sortKey.get )
+        self.version += 1
+        
+    def _position( self, key ):
+        '''
+        Binary search for where an item with the given key belongs, after any items with an
+        equal key so that items keep their relative order.
+        '''
+        low  = 0
+        high = len(self.wlanlist)
+        while low < high:
+            middle = (low + high) // 2
+            other  = self.sortKey[self.wlanlist[middle]]
+            if (other < key) if self.reverse else (other > key):
+                high = middle
+            else:
+                low = middle + 1
+        return low
+    
+    def indexOf( self, item ):
+        '''
+        indexOf - Find where an item is in the list, by binary search on the key it was placed
+                  with rather than by walking the list.
+                  
+        Returns:
+            The index, or -1 if the item is not in the list.
+        '''
+        key = self.sortKey.get( item )
+        if key is None:
+            return -1
+        index = self._position( key ) - 1
+        while index >= 0 and self.sortKey[self.wlanlist[index]] == key:
+            if self.wlanlist[index] is item:
+                return index
+            index -= 1
+        return -1
+    
+    def _insert( self, item ):
+        key = self.keyFunction( item )
+        self.wlanlist.insert( self._position( key ), item )
+        self.sortKey[item] = key
+        
+    def _reposition( self, item ):
+        '''
+        An item has been updated, move it if its key moved far enough.
+        '''
+        key = self.keyFunction( item )
+        old = self.sortKey[item]
+        if key == old:
+            return
+        if self.hysteresis and abs( key - old ) < self.hysteresis:
+            return
+        index = self.indexOf( item )
+        del self.wlanlist[index]
+        self._insert( item )
+        if self.indexOf( item ) != index:
+            self.moves += 1
+        
+    def _update( self, item, rssi, channel ):
+        '''
+        Update a known access point from a scan, and put it back in order.
+        
+        Returns:
+            True if anything changed.
+        '''
+        smoothed = item.smoothed
+        item.addSample( rssi )
+        if item.rssi == rssi and item.channel == channel and item.smoothed == smoothed:
+            return False
+        item.rssi    = rssi
+        item.channel = channel
+        item.version += 1
+        self._reposition( item )
+        self.version += 1
+        return True
+    
     def addItem( self, lan ):
         '''
         addItem - This function adds an item into the WLANList, if and only if it is not a duplicate.
-                  The definition of a duplicate is the BSSID matches.  
+                  The definition of a duplicate is the BSSID matches.  A duplicate updates the
+                  stored item in place, and marks it as seen.
+                  
+        Returns:
+            True if the list changed, i.e. the item is new or its RSSI or channel moved.
         '''
-        for item in self.wlanlist:
-            if item.ssid == lan.ssid:
-                item.rssi = lan.rssi
-                item.channel = lan.channel
-                return
-            elif item.bssid == lan.bssid:
-                item.rssi = lan.rssi
-                item.channel = lan.channel
-                return
+        item = self.table.get( lan.rawBSSID )
+        if item is not None:
+            item.lastSeen = lan.lastSeen
+            return self._update( item, lan.rssi, lan.channel )
 
+        self._makeRoom()
+        lan.attach( self.pool )
         lan.count = self.count
         self.count += 1
-        self.wlanlist.append( lan )
+        self._insert( lan )
+        bssid = lan.rawBSSID
+        self.table[bssid] = lan
+        bssids = self.ssids.get( lan.ssid )
+        if bssids is None:
+            self.ssids[lan.ssid] = [bssid]
+        else:
+            bssids.append( bssid )
+        self.version += 1
+        return True
+    
+    def addScanResult( self, result ):
+        '''
+        addScanResult - Merge one tuple returned by WLAN.scan() into the list.  A WLAN is only
+                        created for an access point we have not seen before, known ones are
+                        updated in place.
+                        
+        Returns:
+            True if the list changed.
+        '''
+        item = self.table.get( result[1] )
+        if item is None:
+            return self.addItem( WLAN( result[0], result[1], result[2], result[3], result[4], result[5] ) )
+        item.lastSeen = time.ticks_ms()
+        return self._update( item, result[3], result[2] )
+    
+    def _remove( self, lan ):
+        '''
+        Drop an access point from both of the indexes, the caller takes care of wlanlist.
+        '''
+        bssid = lan.rawBSSID
+        del self.table[bssid]
+        bssids = self.ssids[lan.ssid]
+        bssids.remove( bssid )
+        if len(bssids) == 0:
+            del self.ssids[lan.ssid]
+        del self.sortKey[lan]
+        lan.detach( self.pool )
+    
+    def ageOut( self, maxAge ):
+        '''
+        ageOut - Remove every WLAN that has not been seen by a scan for maxAge milliseconds.
+        
+        Returns:
+            The number of WLANs removed.
+        '''
+        now  = time.ticks_ms()
+        keep = []
+        for item in self.wlanlist:
+            if item is self.pinned or time.ticks_diff( now, item.lastSeen ) < maxAge:
+                keep.append( item )
+            else:
+                self._remove( item )
+        removed = len(self.wlanlist) - len(keep)
+        if removed:
+            self.wlanlist = keep
+            self.version += 1
+        return removed
+            
+    def resetAges( self ):
+        '''
+        resetAges - Count every network but the pinned one as seen now.  Called when a
+                    network has been watched, as the narrowed scans meanwhile did not
+                    look for the others, so their ages say nothing about them.
+        '''
+        now = time.ticks_ms()
+        for item in self.wlanlist:
+            if item is not self.pinned:
+                item.lastSeen = now
+            
+    def members( self ):
+        return self.wlanlist
+    
+    def _setMembers( self, items ):
+        self.wlanlist = items
+        self.version += 1
+        
+    def stats( self ):
+        '''
+        Returns:
+            The size of the list and the eviction counters.
+        '''
+        return { "items"         : len(self.wlanlist),
+                 "evicted"       : self.evicted,
+                 "evictedMemory" : self.evictedMemory,
+                 "records"       : len(self.pool),
+                 "poolBytes"     : self.pool.memory() }
             
     def defaultSort( self, item ):
         """
@@ -122,43 +528,265 @@ class WLANList:
     
     def sortItems( self, sortFunction=None ):
         """
-        sortItems - This function will automatically sort the wlanlist based on the passed in
-                    sort function.  If there is no sort function provided, this code will utilize
-                    the defaultSort function of sorting by the RSSI of the WLANs.
+        sortItems - The list is kept in order as it changes, so with no sort function this has
+                    nothing left to do.  Given a sort function, the list is sorted on it (best
+                    first, as before) and kept in that order from then on.
         """
-        if sortFunction == None:
-            self.wlanlist.sort( reverse=True, key=self.defaultSort )
-        else:
-            self.wlanlist.sort( reverse=True, key=sortFunction )
+        if sortFunction is not None and sortFunction != self.keyFunction:
+            self.setOrder( (sortFunction, True), 0 )
+
+_TARGET_CHANNEL = const(0)      # how targeted scans are asked of the driver, see _scanTarget
+_TARGET_BSSID   = const(1)
+_TARGET_NONE    = const(2)
 
+#
+# WIFIScanner - scans for wifi networks.
+#
+# A scan is started with startScan(), which returns straight away; the scan itself runs on
+# a second thread (the cyw43 scan blocks until it is done), and its results are handed to
+# the callback by poll(), or returned by awaiting scan().  cancel() abandons a scan when
+# nobody wants its results any more.  The driver cannot abort a scan, so a cancelled scan
+# still keeps the radio busy until it finishes, but its results are dropped.
+#
+# Where _thread is not available (or threaded is False), or the second thread cannot be
+# started (the other core is taken, say), startScan() blocks for the scan, the results
+# are still delivered the same way.
+#
+# While a single network is being watched (see setTarget) scans are narrowed down to that
+# network: by channel and BSSID where the driver takes them, by BSSID alone where it only
+# takes that (the cyw43 driver), and otherwise by matching the raw BSSID of each result.
+# If the network is missing from a narrowed scan, the next scan is a full one, which finds
+# it again should it have moved channel.
+#
 class WIFIScanner:
-    def __init__(self):
+    def __init__(self, threaded=True):
+        '''
+        Parameters:
+            threaded - Run scans on a second thread when _thread is available
+        '''
         self.wlan = network.WLAN()
         self.wlan.active(True)
+        self.threaded   = threaded and _thread is not None
+        self.busy       = False     # a scan is running
+        self.results    = None      # (target, results) of the last scan, until they are collected
+        self.resultTarget = None    # target the results last collected were scanned for, None for a full scan
+        self.callback   = None
+        self.generation = 0         # bumped by cancel, results of older scans are dropped
+        self.scans      = 0
+        self.cancelled  = 0
+        self.failed     = 0         # scans that raised
+        self.target     = None      # (raw BSSID, channel) of the network being watched
+        self.targetMode = _TARGET_CHANNEL
+        self.targetLost = False     # the target was missing from the last scan
+        self.targetedScans = 0
+        
+    def setTarget( self, lan ):
+        '''
+        Narrow the scans down to a single network, until clearTarget() is called.
+        '''
+        self.target     = (lan.rawBSSID, lan.channel)
+        self.targetLost = False
+        
+    def clearTarget( self ):
+        self.target = None
+        
+    def _scanTarget( self, target ):
+        '''
+        Scan for the target network only, as far as the driver allows.  The first
+        time the driver refuses a keyword (with a TypeError) we fall back to the next
+        way of asking, and remember it.
+        
+        Returns:
+            The scan results.
+        '''
+        bssid, channel = target
+        results = None
+        if self.targetLost:
+            results = self.wlan.scan()
+        while results is None and self.targetMode != _TARGET_NONE:
+            try:
+                if self.targetMode == _TARGET_CHANNEL:
+                    results = self.wlan.scan( channel=channel, bssid=bssid )
+                else:
+                    results = self.wlan.scan( bssid=bssid )
+                self.targetedScans += 1
+            except TypeError:
+                self.targetMode += 1
+        if results is None:
+            results = self.wlan.scan()
+        return results
+        
+    def _scan( self, generation, target ):
+        '''
+        Run one scan, on the second thread when threaded.  Whatever goes wrong the
+        scan ends with results (empty if it failed) and busy cleared, so that later
+        scans are not stuck waiting for it.
+        '''
+        results = []
+        try:
+            if target is None:
+                results = self.wlan.scan()
+            else:
+                results = self._scanTarget( target )
+        except Exception as e:
+            print( f"Wifi scan failed: {e}" )
+            self.failed += 1
+        finally:
+            if generation == self.generation:
+                self.results = (target, results)
+            self.scans += 1
+            self.busy = False
+        
+    def startScan( self, callback=None ):
+        '''
+        Start a scan.
+        
+        Parameters:
+            callback - Called by poll() with the list of scan results once the scan is done
+            
+        Returns:
+            False if a scan is still running, True otherwise.
+        '''
+        if self.busy:
+            return False
+        self.busy     = True
+        self.results  = None
+        self.callback = callback
+        if self.threaded:
+            try:
+                _thread.start_new_thread( self._scan, (self.generation, self.target) )
+                return True
+            except Exception as e:
+                print( f"Wifi scan thread failed to start, scanning here: {e}" )
+        self._scan( self.generation, self.target )
+        return True
+    
+    def done( self ):
+        '''
+        Returns:
+            True if the results of a scan are waiting to be collected.
+        '''
+        return self.results is not None
+    
+    def poll( self ):
+        '''
+        Hand the results of a finished scan to the callback given to startScan.  Call
+        this regularly from the main thread, the callback is never called from the
+        scanning thread.
+        
+        Returns:
+            True if a callback was made.
+        '''
+        if self.results is None or self.callback is None:
+            return False
+        callback      = self.callback
+        results       = self._collect()
+        self.callback = None
+        callback( results )
+        return True
+    
+    def _collect( self ):
+        '''
+        Take the results of the last scan, noting the target they were scanned for
+        in resultTarget.  For a narrowed scan, note whether the target was missing,
+        and follow it should it have moved channel.  This runs on the main thread,
+        so the scanning thread never changes the target under it.
+        
+        Returns:
+            The list of scan results.
+        '''
+        self.resultTarget, results = self.results
+        self.results = None
+        target = self.resultTarget
+        if target is not None:
+            bssid, channel = target
+            lost = True
+            for w in results:
+                if w[1] == bssid:
+                    lost = False
+                    if w[2] != channel and self.target is target:
+                        self.target = (bssid, w[2])
+            self.targetLost = lost
+        return results
+    
+    def cancel( self ):
+        '''
+        Abandon the scan that is running, if any, its results are dropped.
+        '''
+        if self.busy or self.results is not None:
+            self.cancelled += 1
+        self.generation += 1
+        self.results  = None
+        self.callback = None
+        
+    async def scan( self ):
+        '''
+        Start a scan, waiting for any scan still running to finish first, and wait for
+        its results.
+        
+        Returns:
+            The list of scan results, or None if the scan was cancelled.
+        '''
+        while not self.startScan():
+            await asyncio.sleep( SCAN_POLL_MS / 1000 )
+        generation = self.generation
+        while self.results is None:
+            if generation != self.generation:
+                return None
+            await asyncio.sleep( SCAN_POLL_MS / 1000 )
+        return self._collect()
+    
+    def _wait( self ):
+        '''
+        Start a scan and block until it is done.
+        
+        Returns:
+            The list of scan results.
+        '''
+        while not self.startScan():
+            time.sleep_ms( SCAN_POLL_MS )
+        while self.results is None:
+            time.sleep_ms( SCAN_POLL_MS )
+        return self._collect()
+    
+    def mergeResults( self, wlanList, results ):
+        '''
+        Merge the results of a scan into a WLANList.
+        
+        Returns:
+            True if anything in wlanList changed.
+        '''
+        changed = False
+        for w in results:
+            if wlanList.addScanResult(w):
+                changed = True
+        return changed
         
     def scanForWLANS( self, wlanList, iterations = 1):
         '''
-        Scan the network looking for wifi networks.
+        Scan the network looking for wifi networks, blocking until done.
         
         Parameters:
             wlanList    - A location to store the data found
             iterations  - Number of times to scan prior to returning to the caller
-        
+            
+        Returns:
+            True if anything in wlanList changed.
         '''
 
+        changed = False
         while( iterations > 0 ):
-            networks = self.wlan.scan()
-            for w in networks:
-                lan = WLAN( w[0].decode(),binascii.hexlify(w[1]).decode(),w[2],w[3],w[4],w[5])
-                wlanList.addItem(lan)
+            if self.mergeResults( wlanList, self._wait() ):
+                changed = True
             
             iterations -= 1
             if iterations > 0:
                 time.sleep( 1 )
+        return changed
 
     def scanForSpecificWLAN( self, ssid, iterations = 10 ):
         '''
-        scanForSpecificWLAN - This routine scans for a specific SSID
+        scanForSpecificWLAN - This routine scans for a specific SSID, blocking until done.
         
         We scan for a specific SSID, and when found return it.  This routine
         can be used to help graph the power of a specific SSID.
@@ -169,12 +797,12 @@ class WIFIScanner:
             
         '''
 
+        target = ssid.encode()
         while( iterations > 0 ):
-            networks = self.wlan.scan()
+            networks = self._wait()
             for w in networks:
-                lan = WLAN( w[0].decode(),binascii.hexlify(w[1]).decode(),w[2],w[3],w[4],w[5])
-                if lan.ssid == ssid:
-                    return lan
+                if w[0] == target:
+                    return WLAN( w[0],w[1],w[2],w[3],w[4],w[5])
             iterations -= 1
             if iterations > 0:
                 time.sleep( 1 )